@@ -1,4 +1,4 @@
-from app import app, db, Product, Location, ProductMovement
+from app import app, db, Product, Location, ProductMovement, rebuild_stock_levels, upgrade_database
 from datetime import datetime, timedelta
 import random
 
@@ -6,7 +6,7 @@ def add_sample_data():
     with app.app_context():
         # Clear existing data
         db.drop_all()
-        db.create_all()
+        upgrade_database()
         
         # Add sample products
         products_data = [
@@ -85,6 +85,7 @@ def add_sample_data():
             db.session.add(movement)
         
         db.session.commit()
+        rebuild_stock_levels()
         print("Sample data added successfully!")
         print(f"Added {len(products_data)} products")
         print(f"Added {len(locations_data)} locations")
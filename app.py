@@ -1,18 +1,96 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import (Flask, render_template, request, redirect, url_for, flash, jsonify, abort,
+                   Response, stream_with_context, g, session, make_response, has_request_context,
+                   before_render_template, template_rendered)
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import Session
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileRequired
 from wtforms import StringField, IntegerField, SelectField, SubmitField, TextAreaField
-from wtforms.validators import DataRequired, NumberRange
-from datetime import datetime
+from wtforms.validators import DataRequired, NumberRange, ValidationError
+from collections import OrderedDict, defaultdict, deque, namedtuple
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from queue import Empty, Full, Queue
+from werkzeug.exceptions import HTTPException
+import base64
+import binascii
+import csv
+import gzip
+import io
+import json
+import numpy as np
 import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+def engine_options(uri):
+    """Return the engine options for ``uri``; in-memory SQLite gets a StaticPool, which takes no sizing."""
+    options = {'pool_pre_ping': True}
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        return options
+    options.update({
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    })
+    return options
 
 app = Flask(__name__)
-app.config['SECRET_KEY'] = 'your-secret-key-here'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///inventory.db'
+app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key-here')
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///inventory.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+app.config['SQLITE_JOURNAL_MODE'] = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+app.config['SQLITE_CACHE_SIZE_KB'] = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 16384))
+app.config['SNAPSHOT_INTERVAL_HOURS'] = 24
+app.config['ALLOW_NEGATIVE_STOCK'] = False
+app.config['PAGE_SIZE'] = 50
+app.config['MAX_PAGE_SIZE'] = 500
+app.config['IMPORT_BATCH_SIZE'] = 5000
+app.config['EXPORT_CHUNK_SIZE'] = 1000
+app.config['DELETE_CHUNK_SIZE'] = 5000
+app.config['ARCHIVE_BLOCK_SIZE'] = 5000
+app.config['TYPEAHEAD_THRESHOLD'] = 500
+app.config['TYPEAHEAD_LIMIT'] = 20
+app.config['N_PLUS_ONE_THRESHOLD'] = 5
+app.config['METRICS_SAMPLE_SIZE'] = 1000
+app.config['PAGE_CACHE_MAX_BYTES'] = 32 * 1024 * 1024
+app.config['PAGE_CACHE_GZIP'] = True
+app.config['ANALYTICS_WINDOWS'] = [7, 30, 90]
+app.config['ANALYTICS_DEFAULT_WINDOW'] = 30
+app.config['ANALYTICS_LEAD_TIME_DAYS'] = 7
+app.config['ANALYTICS_SERVICE_FACTOR'] = 1.65
+app.config['ANALYTICS_ORDER_DAYS'] = 14
+app.config['ANALYTICS_REPORT_LIMIT'] = 200
+app.config['EVENT_STREAM_MAX_CLIENTS'] = 4
+app.config['EVENT_STREAM_TIMEOUT'] = 300
+app.config['EVENT_STREAM_KEEPALIVE'] = 15
+app.config['EVENT_STREAM_RETRY_MS'] = 3000
+app.config['EVENT_QUEUE_SIZE'] = 100
+app.config['EVENT_BACKLOG'] = 1000
 
 db = SQLAlchemy(app)
 
+@db.event.listens_for(Engine, 'connect')
+def configure_sqlite_connection(dbapi_connection, connection_record):
+    """Let readers proceed alongside a writer (WAL) and make writers queue instead of failing."""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={app.config['SQLITE_JOURNAL_MODE']}")
+    cursor.execute(f"PRAGMA busy_timeout={app.config['SQLITE_BUSY_TIMEOUT_MS']}")
+    # Bulk writes touch pages all over the ledger indexes; SQLite's 2 MB default thrashes
+    cursor.execute(f"PRAGMA cache_size=-{app.config['SQLITE_CACHE_SIZE_KB']}")
+    # With WAL, NORMAL only syncs at checkpoints yet still never corrupts the database
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.close()
+
 # Database Models
 class Product(db.Model):
     product_id = db.Column(db.String(50), primary_key=True)
@@ -37,15 +115,93 @@ class ProductMovement(db.Model):
     to_location = db.Column(db.String(50), db.ForeignKey('location.location_id'), nullable=True)
     product_id = db.Column(db.String(50), db.ForeignKey('product.product_id'), nullable=False)
     qty = db.Column(db.Integer, nullable=False)
+    # Synthetic movement carrying a cell's balance forward from archived history
+    opening = db.Column(db.Boolean, nullable=False, default=False)
     
     # Relationships
     product = db.relationship('Product', backref='movements')
     from_loc = db.relationship('Location', foreign_keys=[from_location], backref='outgoing_movements')
     to_loc = db.relationship('Location', foreign_keys=[to_location], backref='incoming_movements')
     
+    # Hot columns for balance aggregates, delete guards and the ordered ledger listing
+    __table_args__ = (
+        db.Index('ix_product_movement_product_to', 'product_id', 'to_location'),
+        db.Index('ix_product_movement_product_from', 'product_id', 'from_location'),
+        db.Index('ix_product_movement_to_location', 'to_location'),
+        db.Index('ix_product_movement_from_location', 'from_location'),
+        db.Index('ix_product_movement_timestamp', 'timestamp', 'movement_id'),
+    )
+    
     def __repr__(self):
         return f'<Movement {self.movement_id}: {self.qty} {self.product_id} from {self.from_location} to {self.to_location}>'
 
+class StockLevel(db.Model):
+    """Materialized balance per (product, location), kept in step with every movement write."""
+    product_id = db.Column(db.String(50), db.ForeignKey('product.product_id'), primary_key=True)
+    location_id = db.Column(db.String(50), db.ForeignKey('location.location_id'), primary_key=True)
+    qty = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<StockLevel {self.product_id} @ {self.location_id}: {self.qty}>'
+
+class StockSnapshot(db.Model):
+    """Checkpoint of every balance, covering all movements with ``timestamp <= taken_at``."""
+    snapshot_id = db.Column(db.Integer, primary_key=True)
+    taken_at = db.Column(db.DateTime, nullable=False, unique=True)
+    
+    def __repr__(self):
+        return f'<StockSnapshot {self.snapshot_id}: {self.taken_at}>'
+
+class SnapshotLevel(db.Model):
+    snapshot_id = db.Column(db.Integer, db.ForeignKey('stock_snapshot.snapshot_id'), primary_key=True)
+    product_id = db.Column(db.String(50), db.ForeignKey('product.product_id'), primary_key=True)
+    location_id = db.Column(db.String(50), db.ForeignKey('location.location_id'), primary_key=True)
+    qty = db.Column(db.Integer, nullable=False)
+    
+    def __repr__(self):
+        return f'<SnapshotLevel {self.snapshot_id} {self.product_id} @ {self.location_id}: {self.qty}>'
+
+class SchemaMigration(db.Model):
+    """One row per migration already applied to this database."""
+    version = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<SchemaMigration {self.version}: {self.name}>'
+
+class LedgerCompaction(db.Model):
+    """One row per compaction; movements up to ``cutoff`` live in MovementArchive."""
+    cutoff = db.Column(db.DateTime, primary_key=True)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<LedgerCompaction {self.cutoff}>'
+
+class MovementArchive(db.Model):
+    """A block of archived movements of one product, stored as zlib-compressed JSON lines."""
+    archive_id = db.Column(db.Integer, primary_key=True)
+    cutoff = db.Column(db.DateTime, db.ForeignKey('ledger_compaction.cutoff'), nullable=False)
+    product_id = db.Column(db.String(50), nullable=False, index=True)
+    first_timestamp = db.Column(db.DateTime, nullable=False)
+    last_timestamp = db.Column(db.DateTime, nullable=False)
+    row_count = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+    
+    def __repr__(self):
+        return f'<MovementArchive {self.archive_id}: {self.row_count} {self.product_id} rows>'
+
+class TableVersion(db.Model):
+    """Change counter and row count per table, kept by triggers on every insert, update and delete."""
+    table_name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    row_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<TableVersion {self.table_name}: {self.version}>'
+
 # Forms
 class ProductForm(FlaskForm):
     product_id = StringField('Product ID', validators=[DataRequired()])
@@ -70,38 +226,2096 @@ class MovementForm(FlaskForm):
     def __init__(self, *args, **kwargs):
         super(MovementForm, self).__init__(*args, **kwargs)
         try:
-            self.product_id.choices = [(p.product_id, f"{p.product_id} - {p.name}") for p in Product.query.all()]
-            self.from_location.choices = [('', 'Select Location')] + [(l.location_id, f"{l.location_id} - {l.name}") for l in Location.query.all()]
-            self.to_location.choices = [('', 'Select Location')] + [(l.location_id, f"{l.location_id} - {l.name}") for l in Location.query.all()]
+            self.movement_choices = movement_choices()
         except Exception:
             # If database is not initialized, provide empty choices
-            self.product_id.choices = []
-            self.from_location.choices = [('', 'Select Location')]
-            self.to_location.choices = [('', 'Select Location')]
+            self.movement_choices = MovementChoices([], [], {})
+        products = self.movement_choices.products
+        # Large catalogs only ship the current product; the rest are fetched as the user types
+        self.product_typeahead = len(products) > app.config['TYPEAHEAD_THRESHOLD']
+        if self.product_typeahead:
+            name = self.movement_choices.product_names.get(self.product_id.data)
+            self.product_id.choices = [(self.product_id.data, f"{self.product_id.data} - {name}")] if name else []
+            # Choices are not the full list here, so membership is checked in validate_product_id
+            self.product_id.validate_choice = False
+        else:
+            self.product_id.choices = products
+        self.from_location.choices = [('', 'Select Location')] + self.movement_choices.locations
+        self.to_location.choices = [('', 'Select Location')] + self.movement_choices.locations
+    
+    def validate_product_id(self, field):
+        if field.data not in self.movement_choices.product_names:
+            raise ValidationError('Not a valid choice.')
+
+class MovementImportForm(FlaskForm):
+    file = FileField('Movements File', validators=[FileRequired()])
+    format = SelectField('Format', choices=[('', 'Detect from file name'), ('csv', 'CSV'), ('jsonl', 'JSON lines')])
+    batch_size = IntegerField('Batch Size', validators=[NumberRange(min=1, max=100000)],
+                              default=lambda: app.config['IMPORT_BATCH_SIZE'])
+    submit = SubmitField('Import Movements')
+
+# Balance Engine
+def ledger_totals(product_id=None, location_id=None, after=None, until=None, movement_ids=None, openings=True):
+    """Build a grouped aggregate of stock levels straight from the movement ledger.
+
+    Incoming quantities are keyed by ``to_location`` and outgoing quantities by
+    ``from_location``; both are folded into a single ``UNION ALL`` and summed, so
+    the cost grows with the number of movements rather than products x locations.
+    The returned select yields ``(product_id, location_id, balance)`` for non-zero
+    cells only, optionally filtered by product or location and restricted to
+    movements with ``after < timestamp <= until`` or to the given ``movement_ids``.
+    Pass ``openings=False`` to leave out the opening balances written by compaction.
+    """
+    incoming = db.select(
+        ProductMovement.product_id.label('product_id'),
+        ProductMovement.to_location.label('location_id'),
+        ProductMovement.qty.label('qty')
+    ).where(ProductMovement.to_location.isnot(None))
+    outgoing = db.select(
+        ProductMovement.product_id.label('product_id'),
+        ProductMovement.from_location.label('location_id'),
+        (-ProductMovement.qty).label('qty')
+    ).where(ProductMovement.from_location.isnot(None))
+
+    if product_id:
+        incoming = incoming.where(ProductMovement.product_id == product_id)
+        outgoing = outgoing.where(ProductMovement.product_id == product_id)
+    if location_id:
+        incoming = incoming.where(ProductMovement.to_location == location_id)
+        outgoing = outgoing.where(ProductMovement.from_location == location_id)
+    if after is not None:
+        incoming = incoming.where(ProductMovement.timestamp > after)
+        outgoing = outgoing.where(ProductMovement.timestamp > after)
+    if until is not None:
+        incoming = incoming.where(ProductMovement.timestamp <= until)
+        outgoing = outgoing.where(ProductMovement.timestamp <= until)
+    if movement_ids is not None:
+        incoming = incoming.where(ProductMovement.movement_id.in_(movement_ids))
+        outgoing = outgoing.where(ProductMovement.movement_id.in_(movement_ids))
+    if not openings:
+        incoming = incoming.where(db.not_(ProductMovement.opening))
+        outgoing = outgoing.where(db.not_(ProductMovement.opening))
+
+    ledger = db.union_all(incoming, outgoing).subquery()
+    return db.select(
+        ledger.c.product_id,
+        ledger.c.location_id,
+        db.func.sum(ledger.c.qty).label('balance')
+    ).group_by(ledger.c.product_id, ledger.c.location_id).having(
+        db.func.sum(ledger.c.qty) != 0
+    )
+
+def compute_balances(product_id=None, location_id=None):
+    """Return non-zero stock levels with product and location names.
+
+    Reads the materialized ``StockLevel`` table, so the cost is proportional to
+    the number of cells returned rather than the size of the ledger.
+    """
+    query = db.select(
+        StockLevel.product_id,
+        Product.name,
+        StockLevel.location_id,
+        Location.name,
+        StockLevel.qty
+    ).join(Product, Product.product_id == StockLevel.product_id).join(
+        Location, Location.location_id == StockLevel.location_id
+    ).where(StockLevel.qty != 0).order_by(StockLevel.product_id, StockLevel.location_id)
+
+    if product_id:
+        query = query.where(StockLevel.product_id == product_id)
+    if location_id:
+        query = query.where(StockLevel.location_id == location_id)
+
+    return [{
+        'product_id': row[0],
+        'product_name': row[1],
+        'location_id': row[2],
+        'location_name': row[3],
+        'balance': row[4]
+    } for row in db.session.execute(query)]
+
+class InsufficientStockError(ValueError):
+    """Raised when a posting would take a stock level below zero."""
+    def __init__(self, product_id, location_id, available, requested):
+        super().__init__(f'Only {available} of {product_id} available at {location_id}; cannot remove {requested}.')
+        self.product_id = product_id
+        self.location_id = location_id
+        self.available = available
+        self.requested = requested
+
+MovementPosting = namedtuple('MovementPosting', ['product_id', 'from_location', 'to_location', 'qty', 'timestamp'])
+
+def movement_posting(movement):
+    return MovementPosting(movement.product_id, movement.from_location, movement.to_location,
+                           movement.qty, movement.timestamp)
+
+def adjust_stock(product_id, location_id, delta, check_available=False):
+    """Add ``delta`` to one stock level cell inside the current transaction.
+
+    With ``check_available``, a decrement only applies while the cell holds at least
+    that much; the check and the decrement are one conditional ``UPDATE``, so two
+    concurrent postings can never both draw down the same units.
+    """
+    if not location_id or not delta:
+        return
+    key = (StockLevel.product_id == product_id) & (StockLevel.location_id == location_id)
+    update = db.update(StockLevel).where(key).values(qty=StockLevel.qty + delta)
+    if check_available and delta < 0:
+        update = update.where(StockLevel.qty >= -delta)
+    updated = db.session.execute(update).rowcount
+    if updated:
+        # Drop cells that net out to zero so the table only holds stock on hand
+        db.session.execute(db.delete(StockLevel).where(key, StockLevel.qty == 0))
+    elif check_available and delta < 0:
+        available = db.session.execute(db.select(StockLevel.qty).where(key)).scalar() or 0
+        raise InsufficientStockError(product_id, location_id, available, -delta)
+    else:
+        db.session.add(StockLevel(product_id=product_id, location_id=location_id, qty=delta))
+        db.session.flush()
+
+def stock_on_hand(cells):
+    """Return ``{(product_id, location_id): qty}`` for those of ``cells`` that hold stock."""
+    cells = list(cells)
+    levels = {}
+    for start in range(0, len(cells), 500):
+        levels.update(((row[0], row[1]), row[2]) for row in db.session.execute(
+            db.select(StockLevel.product_id, StockLevel.location_id, StockLevel.qty).where(
+                db.tuple_(StockLevel.product_id, StockLevel.location_id).in_(cells[start:start + 500]))))
+    return levels
+
+def add_stock_deltas(deltas):
+    """Add each ``{(product_id, location_id): delta}`` to its stock level with one upsert, unchecked.
+
+    For bulk writers that have already checked availability themselves; cells that net
+    out to zero are dropped again, as in ``adjust_stock``.
+    """
+    cells = [(product_id, location_id, delta) for (product_id, location_id), delta in deltas.items()
+             if location_id and delta]
+    if not cells:
+        return
+    connection = db.session.connection()
+    connection.exec_driver_sql(
+        'INSERT INTO stock_level (product_id, location_id, qty) VALUES (?, ?, ?) '
+        'ON CONFLICT (product_id, location_id) DO UPDATE SET qty = qty + excluded.qty', cells)
+    connection.exec_driver_sql('DELETE FROM stock_level WHERE product_id = ? AND location_id = ? AND qty = 0',
+                               [cell[:2] for cell in cells])
+
+def apply_stock_deltas(deltas):
+    """Add each ``{(product_id, location_id): delta}`` to its stock level, increments first.
+
+    Unless ``ALLOW_NEGATIVE_STOCK`` is set, a cell that would go below zero raises
+    ``InsufficientStockError``; the caller rolls back.
+    """
+    check_available = not app.config['ALLOW_NEGATIVE_STOCK']
+    for (product_id, location_id), delta in sorted(deltas.items(), key=lambda item: item[1] < 0):
+        adjust_stock(product_id, location_id, delta, check_available)
+
+def posting_deltas(new=None, old=None):
+    """Return the net stock change per ``(product_id, location_id)`` of replacing ``old`` with ``new``."""
+    deltas = defaultdict(int)
+    for posting, sign in ((old, -1), (new, 1)):
+        if posting is None:
+            continue
+        if posting.to_location:
+            deltas[(posting.product_id, posting.to_location)] += sign * posting.qty
+        if posting.from_location:
+            deltas[(posting.product_id, posting.from_location)] -= sign * posting.qty
+    return deltas
+
+def post_stock(new=None, old=None):
+    """Move the stock levels from reflecting posting ``old`` to reflecting ``new``.
+
+    Adding a movement passes only ``new``, deleting one only ``old``, and an edit both.
+    The net change per cell is applied increments first, and unless
+    ``ALLOW_NEGATIVE_STOCK`` is set any cell that would go below zero raises
+    ``InsufficientStockError``; the caller rolls back. Snapshots at or after a posting's
+    ``timestamp`` are repaired too, so back-dated edits keep point-in-time balances exact.
+    """
+    apply_stock_deltas(posting_deltas(new, old))
+    for posting, sign in ((old, -1), (new, 1)):
+        if posting is not None and posting.timestamp is not None:
+            adjust_snapshots(posting.product_id, posting.to_location, sign * posting.qty, posting.timestamp)
+            adjust_snapshots(posting.product_id, posting.from_location, -sign * posting.qty, posting.timestamp)
+
+def begin_immediate():
+    """Take SQLite's write lock now, so reads until the commit see the state the writes apply to.
+
+    Must run before the transaction's first write; other writers queue on ``busy_timeout``.
+    """
+    if db.engine.dialect.name == 'sqlite':
+        db.session.execute(db.text('BEGIN IMMEDIATE'))
+
+def begin_read():
+    """Start a read transaction, so every read until the rollback sees one snapshot of the database.
+
+    Must run before the transaction's first statement; it takes no lock, so writers carry on.
+    """
+    if db.engine.dialect.name == 'sqlite':
+        db.session.execute(db.text('BEGIN'))
+
+def rebuild_stock_levels():
+    """Recompute the whole ``StockLevel`` table from the movement ledger."""
+    db.session.execute(db.delete(StockLevel))
+    totals = ledger_totals().subquery()
+    db.session.execute(
+        db.insert(StockLevel).from_select(
+            ['product_id', 'location_id', 'qty'],
+            db.select(totals.c.product_id, totals.c.location_id, totals.c.balance)
+        )
+    )
+    db.session.commit()
+    return StockLevel.query.count()
+
+def verify_stock_levels():
+    """Compare ``StockLevel`` with the ledger and return the mismatched cells."""
+    expected = {(row[0], row[1]): row[2] for row in db.session.execute(ledger_totals())}
+    actual = {(row.product_id, row.location_id): row.qty
+              for row in StockLevel.query.filter(StockLevel.qty != 0)}
+    return [{
+        'product_id': key[0],
+        'location_id': key[1],
+        'expected': expected.get(key, 0),
+        'actual': actual.get(key, 0)
+    } for key in sorted(set(expected) | set(actual)) if expected.get(key, 0) != actual.get(key, 0)]
+
+def adjust_snapshots(product_id, location_id, delta, timestamp):
+    """Add ``delta`` to one cell of every snapshot that already includes ``timestamp``."""
+    if not location_id or not delta:
+        return
+    affected = db.select(StockSnapshot.snapshot_id).where(StockSnapshot.taken_at >= timestamp)
+    if db.session.execute(affected.limit(1)).first() is None:
+        return
+    key = (SnapshotLevel.product_id == product_id) & (SnapshotLevel.location_id == location_id)
+    existing = db.select(SnapshotLevel.snapshot_id).where(key)
+    db.session.execute(
+        db.update(SnapshotLevel).where(key, SnapshotLevel.snapshot_id.in_(affected))
+        .values(qty=SnapshotLevel.qty + delta),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.execute(
+        db.insert(SnapshotLevel).from_select(
+            ['snapshot_id', 'product_id', 'location_id', 'qty'],
+            db.select(
+                StockSnapshot.snapshot_id,
+                db.literal(product_id),
+                db.literal(location_id),
+                db.literal(delta)
+            ).where(StockSnapshot.taken_at >= timestamp, StockSnapshot.snapshot_id.not_in(existing))
+        )
+    )
+    db.session.execute(
+        db.delete(SnapshotLevel).where(key, SnapshotLevel.qty == 0),
+        execution_options={'synchronize_session': False}
+    )
+
+def balances_as_of(as_of, product_id=None, location_id=None):
+    """Return non-zero stock levels as they stood at ``as_of``.
+
+    Loads the nearest snapshot taken at or before ``as_of`` and replays only the
+    movements recorded after it, falling back to the full ledger when there is none.
+    Dates before the last compaction are answered from the archive instead.
+    Each cell is a dict with ``product_id``, ``location_id`` and ``balance``.
+    """
+    cutoff = compacted_until()
+    if cutoff is not None and as_of < cutoff:
+        # Archived rows plus any not yet archived by a compaction still in progress
+        levels = archived_totals(as_of, product_id, location_id)
+        for row in db.session.execute(ledger_totals(product_id, location_id, until=as_of, openings=False)):
+            key = (row[0], row[1])
+            levels[key] = levels.get(key, 0) + row[2]
+        return [{'product_id': key[0], 'location_id': key[1], 'balance': qty}
+                for key, qty in sorted(levels.items()) if qty != 0]
+
+    snapshot = StockSnapshot.query.filter(StockSnapshot.taken_at <= as_of).order_by(
+        StockSnapshot.taken_at.desc()
+    ).first()
+
+    levels = {}
+    after = None
+    if snapshot is not None:
+        after = snapshot.taken_at
+        query = SnapshotLevel.query.filter_by(snapshot_id=snapshot.snapshot_id)
+        if product_id:
+            query = query.filter_by(product_id=product_id)
+        if location_id:
+            query = query.filter_by(location_id=location_id)
+        levels = {(level.product_id, level.location_id): level.qty for level in query}
+
+    for row in db.session.execute(ledger_totals(product_id, location_id, after=after, until=as_of)):
+        key = (row[0], row[1])
+        levels[key] = levels.get(key, 0) + row[2]
+
+    return [{'product_id': key[0], 'location_id': key[1], 'balance': qty}
+            for key, qty in sorted(levels.items()) if qty != 0]
+
+def add_balance_names(balance_data):
+    """Fill in ``product_name`` and ``location_name`` on balance cells with two lookups."""
+    product_names = dict(db.session.execute(db.select(Product.product_id, Product.name).where(
+        Product.product_id.in_({item['product_id'] for item in balance_data}))).all())
+    location_names = dict(db.session.execute(db.select(Location.location_id, Location.name).where(
+        Location.location_id.in_({item['location_id'] for item in balance_data}))).all())
+    for item in balance_data:
+        item['product_name'] = product_names.get(item['product_id'])
+        item['location_name'] = location_names.get(item['location_id'])
+    return balance_data
+
+def naive_utc(timestamp):
+    """Return ``timestamp`` as the naive UTC datetime the ledger stores; naive values are already UTC."""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+def ledger_timestamp(timestamp):
+    """Format ``timestamp`` exactly as SQLAlchemy stores a DateTime in SQLite, for rows inserted raw."""
+    return timestamp.isoformat(' ', 'microseconds')
+
+def parse_timestamp(value, end_of_day=False):
+    """Parse an ISO date or datetime as naive UTC; a bare date means the start (or end) of that day."""
+    timestamp = naive_utc(datetime.fromisoformat(value))
+    if end_of_day and len(value) == 10:
+        timestamp += timedelta(days=1) - timedelta(microseconds=1)
+    return timestamp
+
+def take_snapshot(taken_at):
+    """Checkpoint every balance as of ``taken_at`` and return the new snapshot."""
+    levels = balances_as_of(taken_at)
+    snapshot = StockSnapshot(taken_at=taken_at)
+    db.session.add(snapshot)
+    db.session.flush()
+    if levels:
+        db.session.execute(db.insert(SnapshotLevel), [
+            {'snapshot_id': snapshot.snapshot_id, 'product_id': item['product_id'],
+             'location_id': item['location_id'], 'qty': item['balance']}
+            for item in levels
+        ])
+    db.session.commit()
+    return snapshot
+
+def take_due_snapshots(now=None):
+    """Take a snapshot at every ``SNAPSHOT_INTERVAL_HOURS`` boundary not yet covered.
+
+    Each snapshot is built from the previous one plus the movements in between,
+    so catching up costs a single pass over the ledger.
+    """
+    now = now or datetime.utcnow()
+    interval = timedelta(hours=app.config['SNAPSHOT_INTERVAL_HOURS'])
+    last = db.session.execute(db.select(db.func.max(StockSnapshot.taken_at))).scalar()
+    if last is None:
+        last = db.session.execute(db.select(db.func.min(ProductMovement.timestamp))).scalar()
+        if last is None:
+            return 0
+
+    # Align checkpoints to whole intervals since the epoch so they land on predictable boundaries
+    epoch = datetime(1970, 1, 1)
+    boundary = epoch + ((last - epoch) // interval + 1) * interval
+    taken = 0
+    while boundary <= now:
+        take_snapshot(boundary)
+        boundary += interval
+        taken += 1
+    return taken
+
+@app.cli.command('rebuild-stock')
+def rebuild_stock_command():
+    """Rebuild the stock level table from the movement ledger."""
+    db.create_all()
+    count = rebuild_stock_levels()
+    print(f"[OK] Rebuilt {count} stock level(s) from the movement ledger")
+
+@app.cli.command('verify-stock')
+def verify_stock_command():
+    """Check the stock level table against the movement ledger."""
+    mismatches = verify_stock_levels()
+    for item in mismatches:
+        print(f"[ERROR] {item['product_id']} @ {item['location_id']}: "
+              f"expected {item['expected']}, found {item['actual']}")
+    if mismatches:
+        raise SystemExit(1)
+    print("[OK] Stock levels match the movement ledger")
+
+@app.cli.command('take-snapshots')
+def take_snapshots_command():
+    """Checkpoint balances at every interval boundary since the last snapshot."""
+    db.create_all()
+    count = take_due_snapshots()
+    print(f"[OK] Took {count} snapshot(s)")
+
+# Keyset Pagination
+Page = namedtuple('Page', ['items', 'next_cursor', 'prev_cursor', 'per_page'])
+
+def encode_cursor(values):
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, columns):
+    """Turn a cursor back into column values, or abort with 400 if it was tampered with."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError(cursor)
+        return tuple(datetime.fromisoformat(value) if isinstance(column.type, db.DateTime) else value
+                     for column, value in zip(columns, values))
+    except (ValueError, TypeError, binascii.Error):
+        abort(400, description='Invalid page cursor')
+
+def get_page_size():
+    try:
+        per_page = int(request.args.get('per_page', app.config['PAGE_SIZE']))
+    except ValueError:
+        per_page = app.config['PAGE_SIZE']
+    return max(1, min(per_page, app.config['MAX_PAGE_SIZE']))
+
+def paginate_keyset(query, columns, descending=False):
+    """Fetch one page of ``query`` ordered by ``columns`` using the request's cursors.
+
+    Pages seek past the ``after``/``before`` cursor with a row-value comparison on
+    the sort key instead of an OFFSET, so every page costs the same to load no
+    matter how deep into the table it is. ``columns`` must form a unique key.
+    """
+    per_page = get_page_size()
+    after = request.args.get('after')
+    before = request.args.get('before')
+    backwards = bool(before) and not after
+    cursor = decode_cursor(before if backwards else after, columns) if (after or before) else None
+
+    fetch_descending = descending != backwards
+    if cursor is not None:
+        key = db.tuple_(*columns)
+        query = query.filter(key < cursor if fetch_descending else key > cursor)
+    order = [column.desc() if fetch_descending else column.asc() for column in columns]
+    items = query.order_by(*order).limit(per_page + 1).all()
+
+    has_more = len(items) > per_page
+    items = items[:per_page]
+    if backwards:
+        items.reverse()
+
+    def cursor_for(item):
+        return encode_cursor([getattr(item, column.key) for column in columns])
+
+    return make_page(items, [cursor_for(item) for item in items], per_page, has_more, backwards, cursor is not None)
+
+def make_page(items, cursors, per_page, has_more, backwards, had_cursor):
+    next_cursor = cursors[-1] if items and (backwards or has_more) else None
+    prev_cursor = cursors[0] if items and (has_more if backwards else had_cursor) else None
+    return Page(items, next_cursor, prev_cursor, per_page)
+
+# Search Index
+# SQLite FTS5 tables mirroring the searchable columns. Triggers keep them in step with
+# every write path (forms, bulk statements, CLI scripts), keyed by the base table rowid.
+# Bulk imports suspend the per-row movement trigger for the length of their own
+# transaction and index the whole batch with MOVEMENT_SEARCH_FILL instead.
+MOVEMENT_SEARCH_FILL = """INSERT INTO movement_search(rowid, movement_id, product_id, product_name,
+                                from_location, from_name, to_location, to_name)
+    SELECT m.rowid, m.movement_id, m.product_id, p.name, m.from_location, f.name, m.to_location, t.name
+    FROM product_movement m
+    LEFT JOIN product p ON p.product_id = m.product_id
+    LEFT JOIN location f ON f.location_id = m.from_location
+    LEFT JOIN location t ON t.location_id = m.to_location"""
+
+SEARCH_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5(
+        product_id, name, description, prefix='2 3')""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS location_search USING fts5(
+        location_id, name, address, prefix='2 3')""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS movement_search USING fts5(
+        movement_id, product_id, product_name, from_location, from_name, to_location, to_name,
+        prefix='2 3')""",
+    "CREATE TABLE IF NOT EXISTS search_index_suspended (flag INTEGER)",
+    """CREATE TRIGGER IF NOT EXISTS product_search_insert AFTER INSERT ON product BEGIN
+        INSERT INTO product_search(rowid, product_id, name, description)
+        VALUES (new.rowid, new.product_id, new.name, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_search_update AFTER UPDATE ON product BEGIN
+        DELETE FROM product_search WHERE rowid = old.rowid;
+        INSERT INTO product_search(rowid, product_id, name, description)
+        VALUES (new.rowid, new.product_id, new.name, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_search_rename AFTER UPDATE OF name ON product
+    WHEN new.name IS NOT old.name BEGIN
+        UPDATE movement_search SET product_name = new.name
+        WHERE rowid IN (SELECT rowid FROM product_movement WHERE product_id = new.product_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_search_delete AFTER DELETE ON product BEGIN
+        DELETE FROM product_search WHERE rowid = old.rowid;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS location_search_insert AFTER INSERT ON location BEGIN
+        INSERT INTO location_search(rowid, location_id, name, address)
+        VALUES (new.rowid, new.location_id, new.name, new.address);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS location_search_update AFTER UPDATE ON location BEGIN
+        DELETE FROM location_search WHERE rowid = old.rowid;
+        INSERT INTO location_search(rowid, location_id, name, address)
+        VALUES (new.rowid, new.location_id, new.name, new.address);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS location_search_rename AFTER UPDATE OF name ON location
+    WHEN new.name IS NOT old.name BEGIN
+        UPDATE movement_search SET from_name = new.name
+        WHERE rowid IN (SELECT rowid FROM product_movement WHERE from_location = new.location_id);
+        UPDATE movement_search SET to_name = new.name
+        WHERE rowid IN (SELECT rowid FROM product_movement WHERE to_location = new.location_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS location_search_delete AFTER DELETE ON location BEGIN
+        DELETE FROM location_search WHERE rowid = old.rowid;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS movement_search_insert AFTER INSERT ON product_movement
+    WHEN NOT EXISTS (SELECT 1 FROM search_index_suspended) BEGIN
+        INSERT INTO movement_search(rowid, movement_id, product_id, product_name,
+                                    from_location, from_name, to_location, to_name)
+        VALUES (new.rowid, new.movement_id, new.product_id,
+                (SELECT name FROM product WHERE product_id = new.product_id),
+                new.from_location, (SELECT name FROM location WHERE location_id = new.from_location),
+                new.to_location, (SELECT name FROM location WHERE location_id = new.to_location));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS movement_search_update AFTER UPDATE ON product_movement BEGIN
+        DELETE FROM movement_search WHERE rowid = old.rowid;
+        INSERT INTO movement_search(rowid, movement_id, product_id, product_name,
+                                    from_location, from_name, to_location, to_name)
+        VALUES (new.rowid, new.movement_id, new.product_id,
+                (SELECT name FROM product WHERE product_id = new.product_id),
+                new.from_location, (SELECT name FROM location WHERE location_id = new.from_location),
+                new.to_location, (SELECT name FROM location WHERE location_id = new.to_location));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS movement_search_delete AFTER DELETE ON product_movement BEGIN
+        DELETE FROM movement_search WHERE rowid = old.rowid;
+    END""",
+]
+
+SEARCH_REBUILD = [
+    "DELETE FROM product_search",
+    "DELETE FROM location_search",
+    "DELETE FROM movement_search",
+    """INSERT INTO product_search(rowid, product_id, name, description)
+    SELECT rowid, product_id, name, description FROM product""",
+    """INSERT INTO location_search(rowid, location_id, name, address)
+    SELECT rowid, location_id, name, address FROM location""",
+    MOVEMENT_SEARCH_FILL,
+    "INSERT INTO product_search(product_search) VALUES ('optimize')",
+    "INSERT INTO location_search(location_search) VALUES ('optimize')",
+    "INSERT INTO movement_search(movement_search) VALUES ('optimize')",
+]
+
+def search_index_enabled():
+    return db.engine.dialect.name == 'sqlite'
+
+@db.event.listens_for(db.metadata, 'after_create')
+def create_search_index(target, connection, **kw):
+    """Create the FTS5 tables and triggers alongside the models, filling them if new."""
+    if connection.dialect.name != 'sqlite':
+        return
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'movement_search'"
+    ).first()
+    for statement in SEARCH_DDL:
+        connection.exec_driver_sql(statement)
+    if not exists:
+        for statement in SEARCH_REBUILD:
+            connection.exec_driver_sql(statement)
+
+@db.event.listens_for(db.metadata, 'before_drop')
+def drop_search_index(target, connection, **kw):
+    if connection.dialect.name != 'sqlite':
+        return
+    for table in ('product_search', 'location_search', 'movement_search', 'search_index_suspended'):
+        connection.exec_driver_sql(f'DROP TABLE IF EXISTS {table}')
+
+def rebuild_search_index():
+    """Repopulate every search table from the base tables."""
+    connection = db.session.connection()
+    for statement in SEARCH_DDL + SEARCH_REBUILD:
+        connection.exec_driver_sql(statement)
+    db.session.commit()
+
+def match_expression(text):
+    """Turn free text into an FTS5 query that prefix-matches every word."""
+    return ' '.join(f'"{term}"*' for term in re.findall(r'\w+', text))
+
+def search_page(query, key_column, index, text):
+    """Fetch one page of ``query`` rows matching ``text`` in the ``index`` FTS table.
+
+    Results are ordered by FTS5 rank (best match first) and paged with a keyset
+    cursor on ``(rank, key)``, mirroring ``paginate_keyset``.
+    """
+    per_page = get_page_size()
+    match = match_expression(text)
+    if not match:
+        return Page([], None, None, per_page)
+
+    key = key_column.key
+    after = request.args.get('after')
+    before = request.args.get('before')
+    backwards = bool(before) and not after
+    cursor_columns = [db.literal_column('rank', db.Float), key_column]
+    cursor = decode_cursor(before if backwards else after, cursor_columns) if (after or before) else None
+
+    direction = 'DESC' if backwards else 'ASC'
+    sql = f'SELECT {key}, rank FROM {index} WHERE {index} MATCH :match'
+    params = {'match': match, 'limit': per_page + 1}
+    if cursor is not None:
+        sql += f' AND (rank, {key}) {"<" if backwards else ">"} (:rank, :key)'
+        params.update(rank=cursor[0], key=cursor[1])
+    sql += f' ORDER BY rank {direction}, {key} {direction} LIMIT :limit'
+    ranked = db.session.execute(db.text(sql), params).all()
+
+    has_more = len(ranked) > per_page
+    ranked = ranked[:per_page]
+    if backwards:
+        ranked.reverse()
+    found = {getattr(item, key): item for item in query.filter(key_column.in_([row[0] for row in ranked]))}
+    ranked = [row for row in ranked if row[0] in found]
+    items = [found[row[0]] for row in ranked]
+    cursors = [encode_cursor([row[1], row[0]]) for row in ranked]
+    return make_page(items, cursors, per_page, has_more, backwards, cursor is not None)
+
+@app.cli.command('rebuild-search')
+def rebuild_search_command():
+    """Rebuild the full-text search index from the base tables."""
+    db.create_all()
+    rebuild_search_index()
+    print("[OK] Rebuilt the search index")
+
+# Change Tracking
+# Per-table change counters for conditional GETs. Like the search index they are kept by
+# triggers, so bulk statements and CLI scripts bump them as reliably as the forms do.
+# Bulk imports suspend the movement insert trigger along with the search trigger and
+# bump the counter once per batch instead.
+VERSIONED_TABLES = ['location', 'product', 'product_movement', 'stock_level']
+
+BUMP_VERSION = """UPDATE table_version SET version = version + {count}, row_count = row_count + {rows},
+        changed_at = CURRENT_TIMESTAMP WHERE table_name = '{table}'"""
+ROW_COUNT_CHANGE = {'insert': 1, 'update': 0, 'delete': -1}
+
+def version_trigger(table, event):
+    when = ' WHEN NOT EXISTS (SELECT 1 FROM search_index_suspended)' if (table, event) == ('product_movement', 'insert') else ''
+    return f"""CREATE TRIGGER IF NOT EXISTS {table}_version_{event} AFTER {event.upper()} ON {table}{when} BEGIN
+        {BUMP_VERSION.format(count=1, rows=ROW_COUNT_CHANGE[event], table=table)};
+    END"""
+
+VERSION_DDL = [
+    version_trigger(table, event) for table in VERSIONED_TABLES for event in ('insert', 'update', 'delete')
+] + [
+    f"""INSERT OR IGNORE INTO table_version (table_name, version, row_count, changed_at)
+        VALUES ('{table}', 0, (SELECT COUNT(*) FROM {table}), CURRENT_TIMESTAMP)"""
+    for table in VERSIONED_TABLES
+]
+
+@db.event.listens_for(db.metadata, 'after_create')
+def create_change_counters(target, connection, **kw):
+    if connection.dialect.name != 'sqlite':
+        return
+    # Databases from before the row counters keep their old triggers until migration 6 runs
+    columns = {column['name'] for column in db.inspect(connection).get_columns('table_version')}
+    if 'row_count' not in columns:
+        return
+    for statement in VERSION_DDL:
+        connection.exec_driver_sql(statement)
+
+def table_versions(tables):
+    """Return ``(etag, last_modified)`` for the current state of ``tables``, or ``(None, None)``."""
+    rows = TableVersion.query.filter(TableVersion.table_name.in_(tables)).order_by(TableVersion.table_name).all()
+    if len(rows) != len(set(tables)):
+        return None, None
+    last_modified = max(row.changed_at for row in rows).replace(tzinfo=timezone.utc)
+    # The timestamp keeps a recreated database, whose counters restart at 0, from matching old tags
+    etag = '-'.join(str(row.version) for row in rows) + f'-{int(last_modified.timestamp())}'
+    return etag, last_modified
+
+def table_row_counts(tables):
+    """Return ``{table: rows}`` from the change counters without counting, or ``None`` if they are missing."""
+    counts = dict(db.session.execute(db.select(TableVersion.table_name, TableVersion.row_count).where(
+        TableVersion.table_name.in_(tables))).all())
+    return counts if len(counts) == len(set(tables)) else None
+
+def ledger_version():
+    """Return the movement ledger's change counter, or ``None`` if the counters are missing."""
+    return db.session.execute(db.select(TableVersion.version).where(
+        TableVersion.table_name == 'product_movement')).scalar()
+
+# Form Choices
+# Dropdown choices for MovementForm, cached in process and keyed on the product and
+# location change counters, so any write from any process invalidates them.
+MovementChoices = namedtuple('MovementChoices', ['products', 'locations', 'product_names'])
+_choice_cache = {}
+
+def movement_choices():
+    """Return the product and location choices, reloading them only after those tables change."""
+    version, _ = table_versions(['location', 'product'])
+    cached = _choice_cache.get('movement')
+    if version is not None and cached is not None and cached[0] == version:
+        return cached[1]
+    product_names = dict(db.session.execute(
+        db.select(Product.product_id, Product.name).order_by(Product.product_id)).all())
+    locations = db.session.execute(
+        db.select(Location.location_id, Location.name).order_by(Location.location_id)).all()
+    choices = MovementChoices(
+        [(product_id, f"{product_id} - {name}") for product_id, name in product_names.items()],
+        [(location_id, f"{location_id} - {name}") for location_id, name in locations],
+        product_names
+    )
+    _choice_cache['movement'] = (version, choices)
+    return choices
+
+def product_typeahead(text, limit):
+    """Return up to ``limit`` ``(product_id, name)`` rows best matching ``text``."""
+    match = match_expression(text)
+    if match and search_index_enabled():
+        return db.session.execute(db.text(
+            'SELECT product_id, name FROM product_search WHERE product_search MATCH :match '
+            'ORDER BY rank LIMIT :limit'), {'match': match, 'limit': limit}).all()
+    query = db.select(Product.product_id, Product.name).order_by(Product.product_id).limit(limit)
+    if text:
+        query = query.where(Product.product_id.contains(text) | Product.name.contains(text))
+    return db.session.execute(query).all()
+
+# Page Cache
+# Rendered GET pages cached in process, keyed on the endpoint and query string and
+# validated against the change counters of the tables each page reads, so a write from
+# any process makes the next request re-render. Entries are evicted least recently used
+# once their bodies exceed PAGE_CACHE_MAX_BYTES, and stored gzipped if PAGE_CACHE_GZIP.
+CachedPage = namedtuple('CachedPage', ['body', 'mimetype', 'gzipped'])
+
+class PageCache:
+    """Least recently used page store bounded by the total size of the cached bodies."""
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version, page, max_bytes):
+        with self.lock:
+            # A page rendered for a newer version replaces the stale one under the same key
+            stale = self.entries.pop(key, None)
+            if stale is not None:
+                self.size -= len(stale[1].body)
+            if len(page.body) > max_bytes:
+                return
+            self.entries[key] = (version, page)
+            self.size += len(page.body)
+            while self.size > max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= len(evicted.body)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+page_cache = PageCache()
+
+def page_response(page, status):
+    body = page.body
+    response = Response(mimetype=page.mimetype)
+    if page.gzipped and request.accept_encodings['gzip']:
+        response.headers['Content-Encoding'] = 'gzip'
+    elif page.gzipped:
+        body = gzip.decompress(body)
+    response.set_data(body)
+    response.vary.add('Accept-Encoding')
+    response.headers['X-Cache'] = status
+    return response
+
+def cached_page(tables):
+    """Serve a GET view from the page cache until a table in ``tables`` changes.
+
+    Pages rendered with flashed messages are per user, so requests with messages pending
+    or added by the view bypass the cache, as does any response other than a plain 200.
+    """
+    def decorator(view):
+        @wraps(view)
+        def cached_view(*args, **kwargs):
+            max_bytes = app.config['PAGE_CACHE_MAX_BYTES']
+            version = None
+            if max_bytes and '_flashes' not in session:
+                version, _ = table_versions(tables)
+            if version is None:
+                return view(*args, **kwargs)
+            key = (request.endpoint, tuple(sorted(request.args.items(multi=True))))
+            page = page_cache.get(key, version)
+            if page is not None:
+                return page_response(page, 'HIT')
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed or session.modified:
+                return response
+            gzipped = app.config['PAGE_CACHE_GZIP']
+            body = response.get_data()
+            page = CachedPage(gzip.compress(body) if gzipped else body, response.mimetype, gzipped)
+            page_cache.put(key, version, page, max_bytes)
+            return page_response(page, 'MISS')
+        return cached_view
+    return decorator
+
+# Bulk Import
+ImportResult = namedtuple('ImportResult', ['imported', 'errors'])
+
+def detect_import_format(filename):
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+def read_movement_rows(stream, fmt):
+    """Yield ``(line_number, row, error)`` from a CSV or JSON-lines text stream, one row at a time."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, f'Invalid JSON: {e}'
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, 'Expected a JSON object'
+            continue
+        yield line_number, row, None
+
+def validate_movement_row(row, product_ids, location_ids, default_timestamp):
+    """Check one imported row against the known ids and return ``(record, error)``.
+
+    The record's timestamp is already formatted by ``ledger_timestamp`` (as is
+    ``default_timestamp``), so rows can be inserted without per-row type conversion.
+    """
+    values = {name: str(value).strip() for name, value in row.items() if value is not None}
+    movement_id = values.get('movement_id', '')
+    product_id = values.get('product_id', '')
+    from_location = values.get('from_location', '') or None
+    to_location = values.get('to_location', '') or None
+    if not movement_id:
+        return None, 'Missing movement_id'
+    if product_id not in product_ids:
+        return None, f'Unknown product "{product_id}"'
+    if not from_location and not to_location:
+        return None, 'At least one location (from or to) is required'
+    for location_id in (from_location, to_location):
+        if location_id and location_id not in location_ids:
+            return None, f'Unknown location "{location_id}"'
+    try:
+        qty = int(values.get('qty', ''))
+    except ValueError:
+        return None, f'Invalid quantity "{values.get("qty", "")}"'
+    if qty < 1:
+        return None, 'Quantity must be at least 1'
+    timestamp = default_timestamp
+    if values.get('timestamp'):
+        try:
+            timestamp = ledger_timestamp(naive_utc(datetime.fromisoformat(values['timestamp'])))
+        except ValueError:
+            return None, f'Invalid timestamp "{values["timestamp"]}"'
+    return {
+        'movement_id': movement_id,
+        'timestamp': timestamp,
+        'product_id': product_id,
+        'from_location': from_location,
+        'to_location': to_location,
+        'qty': qty
+    }, None
+
+def insert_movement_batch(batch):
+    """Insert one batch of validated ``(line_number, record)`` pairs in a single transaction.
+
+    Rows whose movement id already exists, and unless ``ALLOW_NEGATIVE_STOCK`` is set
+    rows that would take a location below zero (checked in file order against a
+    running total), are reported instead of inserted, so one bad row never aborts the
+    rest of the batch. Rows go in as plain tuples through the DBAPI's ``executemany``
+    and stock levels take one upsert per (product, location) cell, all under the
+    write lock taken before anything is read.
+    """
+    begin_immediate()
+    existing = set()
+    ids = [record['movement_id'] for _, record in batch]
+    connection = db.session.connection()
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        existing.update(row[0] for row in connection.exec_driver_sql(
+            f'SELECT movement_id FROM product_movement WHERE movement_id IN ({", ".join("?" * len(chunk))})',
+            tuple(chunk)))
+
+    check_available = not app.config['ALLOW_NEGATIVE_STOCK']
+    on_hand = stock_on_hand({(record['product_id'], record['from_location'])
+                             for _, record in batch if record['from_location']}) if check_available else {}
+    errors = []
+    records = []
+    deltas = defaultdict(int)
+    for line_number, record in batch:
+        if record['movement_id'] in existing:
+            errors.append((line_number, f'Movement ID "{record["movement_id"]}" already exists'))
+            continue
+        source = (record['product_id'], record['from_location'])
+        if check_available and record['from_location']:
+            available = on_hand.get(source, 0) + deltas[source]
+            if available < record['qty']:
+                errors.append((line_number, str(InsufficientStockError(*source, available, record['qty']))))
+                continue
+        existing.add(record['movement_id'])
+        records.append(record)
+        if record['to_location']:
+            deltas[(record['product_id'], record['to_location'])] += record['qty']
+        if record['from_location']:
+            deltas[source] -= record['qty']
+
+    if records:
+        suspend_search = search_index_enabled()
+        if suspend_search:
+            last_rowid = db.session.execute(db.text('SELECT COALESCE(MAX(rowid), 0) FROM product_movement')).scalar()
+            db.session.execute(db.text('INSERT INTO search_index_suspended (flag) VALUES (1)'))
+        connection.exec_driver_sql(
+            'INSERT INTO product_movement (movement_id, timestamp, product_id, from_location, to_location, qty, '
+            'opening) VALUES (?, ?, ?, ?, ?, ?, 0)',
+            [(record['movement_id'], record['timestamp'], record['product_id'], record['from_location'],
+              record['to_location'], record['qty']) for record in records])
+        if suspend_search:
+            db.session.execute(db.text(MOVEMENT_SEARCH_FILL + ' WHERE m.rowid > :last_rowid'), {'last_rowid': last_rowid})
+            db.session.execute(db.text(BUMP_VERSION.format(count=len(records), rows=len(records),
+                                                           table='product_movement')))
+            db.session.execute(db.text('DELETE FROM search_index_suspended'))
+        add_stock_deltas(deltas)
+
+        # Back-dated rows must also repair any snapshot that already covers them
+        earliest = datetime.fromisoformat(min(record['timestamp'] for record in records))
+        if StockSnapshot.query.filter(StockSnapshot.taken_at >= earliest).first() is not None:
+            for record in records:
+                timestamp = datetime.fromisoformat(record['timestamp'])
+                adjust_snapshots(record['product_id'], record['to_location'], record['qty'], timestamp)
+                adjust_snapshots(record['product_id'], record['from_location'], -record['qty'], timestamp)
+    db.session.commit()
+    return len(records), errors
+
+def import_movements(stream, fmt='csv', batch_size=None, progress=None):
+    """Stream movements from a CSV or JSON-lines text stream into the ledger.
+
+    Product and location references are validated against in-memory id sets and
+    valid rows are inserted with ``executemany`` in batches of ``batch_size``
+    (``IMPORT_BATCH_SIZE`` by default), one transaction per batch. Invalid rows are
+    collected as ``(line_number, message)`` errors and skipped. ``progress`` is called
+    with the running count of imported rows after every batch.
+    """
+    batch_size = batch_size or app.config['IMPORT_BATCH_SIZE']
+    product_ids = set(db.session.execute(db.select(Product.product_id)).scalars())
+    location_ids = set(db.session.execute(db.select(Location.location_id)).scalars())
+    default_timestamp = ledger_timestamp(datetime.utcnow())
+
+    imported = 0
+    errors = []
+    batch = []
+    for line_number, row, error in read_movement_rows(stream, fmt):
+        if error is None:
+            record, error = validate_movement_row(row, product_ids, location_ids, default_timestamp)
+        if error is not None:
+            errors.append((line_number, error))
+            continue
+        batch.append((line_number, record))
+        if len(batch) >= batch_size:
+            count, batch_errors = insert_movement_batch(batch)
+            imported += count
+            errors.extend(batch_errors)
+            batch = []
+            if progress:
+                progress(imported)
+    if batch:
+        count, batch_errors = insert_movement_batch(batch)
+        imported += count
+        errors.extend(batch_errors)
+        if progress:
+            progress(imported)
+    return ImportResult(imported, sorted(errors))
+
+# Ledger Archive
+# Compaction moves movements up to a cutoff into compressed MovementArchive blocks and
+# replaces them with one opening-balance movement per (product, location). Each product
+# is compacted in its own transaction whose net stock change is zero, so current
+# balances stay exact and reads keep being served while the job runs.
+def compacted_until():
+    return db.session.execute(db.select(db.func.max(LedgerCompaction.cutoff))).scalar()
+
+def pack_archive_block(rows):
+    lines = [json.dumps([value.isoformat() if isinstance(value, datetime) else value for value in row])
+             for row in rows]
+    return zlib.compress('\n'.join(lines).encode())
+
+def archived_movements(start=None, end=None, product_id=None, location_id=None):
+    """Yield archived movement rows (in ``MOVEMENT_EXPORT_FIELDS`` order) matching the filters.
+
+    Only blocks whose product and time span can match are decompressed. Rows come
+    out grouped by product and in time order within each product.
+    """
+    query = db.select(MovementArchive.data).order_by(MovementArchive.product_id, MovementArchive.first_timestamp)
+    if start is not None:
+        query = query.where(MovementArchive.last_timestamp >= start)
+    if end is not None:
+        query = query.where(MovementArchive.first_timestamp <= end)
+    if product_id:
+        query = query.where(MovementArchive.product_id == product_id)
+    for data in iter_query_rows(query, chunk_size=10):
+        for line in zlib.decompress(data[0]).decode().split('\n'):
+            row = json.loads(line)
+            row[1] = datetime.fromisoformat(row[1])
+            if start is not None and row[1] < start or end is not None and row[1] > end:
+                continue
+            if location_id and location_id not in (row[3], row[4]):
+                continue
+            yield row
+
+def archived_totals(until, product_id=None, location_id=None):
+    """Sum archived movements up to ``until`` into ``{(product_id, location_id): balance}``."""
+    levels = defaultdict(int)
+    for _, _, row_product, from_location, to_location, qty in archived_movements(
+            end=until, product_id=product_id, location_id=location_id):
+        if to_location and (not location_id or to_location == location_id):
+            levels[(row_product, to_location)] += qty
+        if from_location and (not location_id or from_location == location_id):
+            levels[(row_product, from_location)] -= qty
+    return dict(levels)
+
+def compact_product(product_id, cutoff):
+    """Archive one product's movements up to ``cutoff`` and write its opening balances.
+
+    Runs as one transaction under the write lock, so the archive and the openings come
+    from the same history that gets deleted.
+    """
+    begin_immediate()
+    block_size = app.config['ARCHIVE_BLOCK_SIZE']
+    history = movement_export_query(end=cutoff, product_id=product_id).where(db.not_(ProductMovement.opening))
+    archived = 0
+    for block in db.session.execute(history, execution_options={'yield_per': block_size}).partitions():
+        db.session.add(MovementArchive(cutoff=cutoff, product_id=product_id, first_timestamp=block[0][1],
+                                       last_timestamp=block[-1][1], row_count=len(block),
+                                       data=pack_archive_block(block)))
+        archived += len(block)
+
+    # Totals include earlier opening balances, which are replaced rather than archived
+    totals = db.session.execute(ledger_totals(product_id=product_id, until=cutoff)).all()
+    db.session.execute(db.delete(ProductMovement).where(
+        ProductMovement.product_id == product_id, ProductMovement.timestamp <= cutoff))
+    openings = [{
+        'movement_id': f'OB-{cutoff:%Y%m%d%H%M%S}-{row[0]}-{row[1]}',
+        'timestamp': cutoff,
+        'product_id': row[0],
+        'from_location': row[1] if row[2] < 0 else None,
+        'to_location': row[1] if row[2] > 0 else None,
+        'qty': abs(row[2]),
+        'opening': True
+    } for row in totals]
+    if openings:
+        db.session.execute(ProductMovement.__table__.insert(), openings)
+    db.session.commit()
+    return archived, len(openings)
+
+def compact_ledger(cutoff, progress=None):
+    """Archive every movement up to ``cutoff`` and return ``(archived, openings)`` counts.
+
+    Snapshots taken before the cutoff are dropped first: the movements they would be
+    replayed from are no longer in the ledger, and those dates are answered from the
+    archive instead.
+    """
+    latest = compacted_until()
+    if latest is not None and cutoff <= latest:
+        raise ValueError(f'The ledger is already compacted up to {latest}')
+    compaction = LedgerCompaction(cutoff=cutoff)
+    db.session.add(compaction)
+    stale = db.select(StockSnapshot.snapshot_id).where(StockSnapshot.taken_at < cutoff)
+    db.session.execute(db.delete(SnapshotLevel).where(SnapshotLevel.snapshot_id.in_(stale)))
+    db.session.execute(db.delete(StockSnapshot).where(StockSnapshot.taken_at < cutoff))
+    db.session.commit()
+
+    product_ids = db.session.execute(db.select(ProductMovement.product_id).where(
+        ProductMovement.timestamp <= cutoff).distinct()).scalars().all()
+    archived = openings = 0
+    for count, product_id in enumerate(product_ids, 1):
+        product_archived, product_openings = compact_product(product_id, cutoff)
+        archived += product_archived
+        openings += product_openings
+        if progress:
+            progress(count, len(product_ids))
+    compaction.finished_at = datetime.utcnow()
+    db.session.commit()
+    return archived, openings
+
+# Bulk Delete
+DeleteResult = namedtuple('DeleteResult', ['deleted', 'error'])
+
+def delete_movements(start=None, end=None, product_id=None, location_id=None, chunk_size=None, progress=None):
+    """Delete every movement matching the filters and return how many were deleted.
+
+    Works through the matches ``chunk_size`` at a time, one transaction per chunk
+    holding the write lock from its first read: the chunk's stock is reversed with a
+    single grouped aggregate and its rows go in one ``DELETE``, so no ORM objects are
+    loaded. Unless ``ALLOW_NEGATIVE_STOCK`` is set, the net reversal of the whole
+    selection is checked once, in the first chunk's transaction; if it would take a
+    location below zero nothing is deleted and its message is returned as ``error``.
+    Chunks are not checked on their own, as an early chunk of receipts may well have
+    shipped out again in a later one. With no filters the whole ledger goes, so stock is
+    not reversed chunk by chunk but cleared once the ledger is empty.
+
+    Snapshots taken at or after a deleted movement are dropped rather than repaired;
+    point-in-time reports fall back to an earlier snapshot plus replay until
+    ``take-snapshots`` fills the gap again.
+    """
+    chunk_size = chunk_size or app.config['DELETE_CHUNK_SIZE']
+    keys = filter_movements(db.select(ProductMovement.movement_id), start, end, product_id, location_id)
+    filtered = start is not None or end is not None or bool(product_id) or bool(location_id)
+    begin_immediate()
+    if filtered and not app.config['ALLOW_NEGATIVE_STOCK']:
+        reversal = {(row[0], row[1]): -row[2] for row in db.session.execute(
+            ledger_totals(movement_ids=keys.correlate(None)))}
+        on_hand = stock_on_hand(cell for cell, delta in reversal.items() if delta < 0)
+        for cell, delta in reversal.items():
+            available = on_hand.get(cell, 0)
+            if available + delta < 0:
+                db.session.rollback()
+                return DeleteResult(0, f'Cannot delete these movements: '
+                                       f'{InsufficientStockError(*cell, available, -delta)}')
+    deleted = 0
+    while True:
+        movement_ids = db.session.execute(keys.limit(chunk_size)).scalars().all()
+        if not movement_ids:
+            if not filtered:
+                db.session.execute(db.delete(StockLevel))
+            db.session.commit()
+            break
+        if filtered:
+            for row in db.session.execute(ledger_totals(movement_ids=movement_ids)).all():
+                adjust_stock(row[0], row[1], -row[2])
+        earliest = db.session.execute(db.select(db.func.min(ProductMovement.timestamp)).where(
+            ProductMovement.movement_id.in_(movement_ids))).scalar()
+        stale = db.select(StockSnapshot.snapshot_id).where(StockSnapshot.taken_at >= earliest)
+        db.session.execute(db.delete(SnapshotLevel).where(SnapshotLevel.snapshot_id.in_(stale)))
+        db.session.execute(db.delete(StockSnapshot).where(StockSnapshot.taken_at >= earliest))
+        db.session.execute(db.delete(ProductMovement).where(ProductMovement.movement_id.in_(movement_ids)))
+        db.session.commit()
+        deleted += len(movement_ids)
+        if progress:
+            progress(deleted)
+        begin_immediate()
+    return DeleteResult(deleted, None)
+
+def movement_references(product_id=None, location_id=None):
+    """Count the movements referencing a product or location, or return 0 straight away when none do.
+
+    The ``EXISTS`` probe stops at the first matching index entry, so the common case of
+    an unused record never walks the ledger; the count is only taken for the error message.
+    """
+    if product_id is not None:
+        condition = ProductMovement.product_id == product_id
+    else:
+        condition = (ProductMovement.from_location == location_id) | (ProductMovement.to_location == location_id)
+    if not db.session.execute(db.select(db.exists().where(condition))).scalar():
+        return 0
+    return db.session.execute(db.select(db.func.count()).select_from(ProductMovement).where(condition)).scalar()
+
+# Export
+MOVEMENT_EXPORT_FIELDS = ['movement_id', 'timestamp', 'product_id', 'from_location', 'to_location', 'qty']
+BALANCE_EXPORT_FIELDS = ['product_id', 'product_name', 'location_id', 'location_name', 'balance']
+EXPORT_MIMETYPES = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+def filter_movements(query, start=None, end=None, product_id=None, location_id=None):
+    """Restrict a movement query to a date range, a product and a location (as source or destination)."""
+    if start is not None:
+        query = query.where(ProductMovement.timestamp >= start)
+    if end is not None:
+        query = query.where(ProductMovement.timestamp <= end)
+    if product_id:
+        query = query.where(ProductMovement.product_id == product_id)
+    if location_id:
+        query = query.where((ProductMovement.from_location == location_id) |
+                            (ProductMovement.to_location == location_id))
+    return query
+
+def movement_export_query(start=None, end=None, product_id=None, location_id=None):
+    """Select ledger rows in ``(timestamp, movement_id)`` order, optionally filtered."""
+    query = db.select(*[getattr(ProductMovement, field) for field in MOVEMENT_EXPORT_FIELDS]).order_by(
+        ProductMovement.timestamp, ProductMovement.movement_id
+    )
+    return filter_movements(query, start, end, product_id, location_id)
+
+def balance_export_query(product_id=None, location_id=None):
+    """Select current stock levels with names, in the same order as the balance report."""
+    query = db.select(
+        StockLevel.product_id,
+        Product.name,
+        StockLevel.location_id,
+        Location.name,
+        StockLevel.qty
+    ).join(Product, Product.product_id == StockLevel.product_id).join(
+        Location, Location.location_id == StockLevel.location_id
+    ).where(StockLevel.qty != 0).order_by(StockLevel.product_id, StockLevel.location_id)
+    if product_id:
+        query = query.where(StockLevel.product_id == product_id)
+    if location_id:
+        query = query.where(StockLevel.location_id == location_id)
+    return query
+
+def iter_query_rows(query, chunk_size=None):
+    """Yield result rows while holding at most one ``yield_per`` chunk in memory."""
+    result = db.session.execute(query, execution_options={
+        'yield_per': chunk_size or app.config['EXPORT_CHUNK_SIZE']
+    })
+    for partition in result.partitions():
+        yield from partition
+
+def iter_export(rows, fields, fmt, chunk_size=None):
+    """Encode rows as CSV (with a header) or JSON lines, yielding one text chunk per batch of rows."""
+    chunk_size = chunk_size or app.config['EXPORT_CHUNK_SIZE']
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(fields)
+    for count, row in enumerate(rows, 1):
+        values = [value.isoformat() if isinstance(value, datetime) else value for value in row]
+        if writer:
+            writer.writerow(values)
+        else:
+            buffer.write(json.dumps(dict(zip(fields, values))) + '\n')
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def export_response(chunks, name, fmt):
+    return Response(stream_with_context(chunks), mimetype=EXPORT_MIMETYPES[fmt], headers={
+        'Content-Disposition': f'attachment; filename={name}.{fmt}'
+    })
+
+def export_args():
+    """Read the export format followed by the ``filter_args`` filters."""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_MIMETYPES:
+        abort(400, description='Format must be csv or jsonl')
+    return (fmt,) + filter_args()
+
+def filter_args():
+    """Read the date range and product/location movement filters shared by exports, the API and bulk delete."""
+    try:
+        start = parse_timestamp(request.args['start']) if request.args.get('start') else None
+        end = parse_timestamp(request.args['end'], end_of_day=True) if request.args.get('end') else None
+    except ValueError:
+        abort(400, description='Dates must be YYYY-MM-DD or YYYY-MM-DDTHH:MM')
+    return start, end, request.args.get('product_id', '').strip(), request.args.get('location_id', '').strip()
+
+# Movement Analytics
+# Outflow velocity, days of cover, turnover and reorder points per (product, location) over
+# the trailing ANALYTICS_WINDOWS days. Daily outflow for the longest window, and the stock
+# on hand of every cell in it, are fetched in one statement (SQLite groups the outflow by
+# cell and day) and held in NumPy arrays in process. While the ledger's change counter
+# shows nothing but inserts, newer movements are folded in by rowid; any update or delete
+# rebuilds the state. Outflow is every movement out of a location, transfers included.
+ANALYTICS_FIELDS = ['product_id', 'product_name', 'location_id', 'location_name', 'on_hand', 'outflow',
+                    'velocity', 'days_of_cover', 'turnover', 'reorder_point', 'suggested_order']
+UNIX_EPOCH_JULIAN_DAY = 2440587.5
+EPOCH_DAY = f'CAST(julianday(timestamp) - {UNIX_EPOCH_JULIAN_DAY} AS INTEGER)'
+
+# Rows with a day are daily outflow; rows without one are the cells' stock on hand.
+# The GROUP BY would otherwise tempt the planner into walking the whole ledger in
+# product order instead of reading just the window from the timestamp index.
+ANALYTICS_OUTFLOW = f"""WITH daily AS (
+        SELECT product_id, from_location AS location_id, {EPOCH_DAY} AS day, SUM(qty) AS qty
+        FROM product_movement INDEXED BY ix_product_movement_timestamp
+        WHERE timestamp >= :start AND from_location IS NOT NULL AND NOT opening
+        GROUP BY product_id, from_location, day
+    )
+    SELECT product_id, location_id, day, qty FROM daily
+    UNION ALL
+    SELECT stock_level.product_id, stock_level.location_id, NULL, stock_level.qty
+    FROM (SELECT DISTINCT product_id, location_id FROM daily) AS cells
+    JOIN stock_level ON stock_level.product_id = cells.product_id AND stock_level.location_id = cells.location_id"""
+
+def epoch_day(timestamp):
+    return (timestamp - datetime(1970, 1, 1)).days
+
+class MovementAnalytics:
+    """Daily outflow and stock on hand per cell, kept in step with the ledger, plus per-window reports."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.last_rowid = None
+        self.cells = {}
+        self.keys = []
+        self.reports = {}
+
+    def cell_indexes(self, products, locations):
+        """Return the index of each (product, location) cell, numbering unseen cells as they appear."""
+        cells = self.cells
+        indexes = [cells.setdefault(key, len(cells)) for key in zip(products, locations)]
+        if len(cells) > len(self.keys):
+            self.keys = list(cells)
+        return np.array(indexes, np.int64)
+
+    def refresh(self, first_day):
+        """Bring the state up to date with the ledger, keeping outflow from ``first_day`` on."""
+        if self.version is not None and self.first_day < first_day:
+            keep = self.day >= first_day
+            self.cell, self.day, self.qty = self.cell[keep], self.day[keep], self.qty[keep]
+            self.first_day = first_day
+            self.reports.clear()
+        begin_read()
+        try:
+            version = ledger_version()
+            if version is None or self.version is None or version < self.version:
+                self.rebuild(version, first_day)
+            elif version > self.version:
+                # Every insert bumps the counter once, so a matching count means nothing else changed
+                added = db.session.execute(db.text(
+                    f'SELECT rowid, product_id, from_location, to_location, qty, opening, {EPOCH_DAY} '
+                    f'FROM product_movement WHERE rowid > :rowid ORDER BY rowid'), {'rowid': self.last_rowid}).all()
+                if len(added) == version - self.version:
+                    self.append(version, added, first_day)
+                else:
+                    self.rebuild(version, first_day)
+        finally:
+            db.session.rollback()
+
+    def rebuild(self, version, first_day):
+        start = datetime(1970, 1, 1) + timedelta(days=first_day)
+        rows = db.session.execute(db.text(ANALYTICS_OUTFLOW), {'start': start.strftime('%Y-%m-%d')}).all()
+        daily = [row for row in rows if row[2] is not None]
+        stock = [row for row in rows if row[2] is None]
+        self.cells = {}
+        self.keys = []
+        products, locations, days, quantities = zip(*daily) if daily else ((), (), (), ())
+        self.cell = self.cell_indexes(products, locations)
+        self.day = np.array(days, np.int64)
+        self.qty = np.array(quantities, np.int64)
+        self.on_hand = np.zeros(len(self.cells), np.int64)
+        self.on_hand[[self.cells[(row[0], row[1])] for row in stock]] = [row[3] for row in stock]
+        self.version = version
+        self.last_rowid = db.session.execute(db.text('SELECT COALESCE(MAX(rowid), 0) FROM product_movement')).scalar()
+        self.first_day = first_day
+        self.reports.clear()
+
+    def stock_levels(self, keys):
+        """Return the stock on hand of each (product, location) cell in ``keys``."""
+        levels = stock_on_hand(keys)
+        return np.array([levels.get(key, 0) for key in keys], np.int64)
+
+    def append(self, version, rows, first_day):
+        """Apply newly inserted movements ``(rowid, product, from, to, qty, opening, day)`` to the state."""
+        counted = [row for row in rows if row[2] is not None and not row[5] and row[6] >= first_day]
+        held = len(self.cells)
+        cells = self.cell_indexes([row[1] for row in counted], [row[2] for row in counted])
+        # Cells read now already include these movements, so only those held before are moved
+        self.on_hand = np.concatenate([self.on_hand, self.stock_levels(self.keys[held:])])
+        for row in rows:
+            for location, sign in ((row[2], -1), (row[3], 1)):
+                index = self.cells.get((row[1], location))
+                if index is not None and index < held:
+                    self.on_hand[index] += sign * row[4]
+
+        if counted:
+            cell = np.concatenate([self.cell, cells])
+            day = np.concatenate([self.day, np.array([row[6] for row in counted], np.int64)])
+            qty = np.concatenate([self.qty, np.array([row[4] for row in counted], np.int64)])
+            # Fold rows for a cell and day already held into one, as the daily spread needs day totals
+            keys, inverse = np.unique(cell * (1 << 32) + (day - first_day), return_inverse=True)
+            self.qty = np.bincount(inverse, weights=qty).astype(np.int64)
+            self.cell = keys >> 32
+            self.day = (keys & 0xFFFFFFFF) + first_day
+        self.version = version
+        self.last_rowid = rows[-1][0]
+        self.reports.clear()
+
+    def report(self, window, today):
+        """Return the per-cell figures for the ``window`` days up to ``today``, ordered by days of cover."""
+        report = self.reports.get((window, today))
+        if report is not None:
+            return report
+        in_window = (self.day > today - window) & (self.day <= today)
+        cell = self.cell[in_window]
+        qty = self.qty[in_window].astype(np.float64)
+        outflow = np.bincount(cell, weights=qty, minlength=len(self.cells))
+        squares = np.bincount(cell, weights=qty * qty, minlength=len(self.cells))
+        active = np.flatnonzero(outflow)
+        outflow = outflow[active]
+        squares = squares[active]
+        velocity = outflow / window
+        # Spread of daily outflow, counting the days without any
+        deviation = np.sqrt(np.maximum(squares / window - velocity * velocity, 0))
+        on_hand = self.on_hand[active]
+        lead_time = app.config['ANALYTICS_LEAD_TIME_DAYS']
+        reorder_point = np.ceil(velocity * lead_time +
+                                app.config['ANALYTICS_SERVICE_FACTOR'] * deviation * np.sqrt(lead_time))
+        days_of_cover = np.maximum(on_hand, 0) / velocity
+        with np.errstate(divide='ignore'):
+            turnover = np.where(on_hand > 0, velocity * 365 / on_hand, np.nan)
+        suggested_order = np.where(
+            on_hand <= reorder_point,
+            np.ceil(reorder_point + velocity * app.config['ANALYTICS_ORDER_DAYS'] - on_hand), 0)
+        order = np.lexsort((active, days_of_cover))
+        report = {
+            'cell': active[order],
+            'on_hand': on_hand[order],
+            'outflow': outflow[order],
+            'velocity': velocity[order],
+            'days_of_cover': days_of_cover[order],
+            'turnover': turnover[order],
+            'reorder_point': reorder_point[order],
+            'suggested_order': suggested_order[order]
+        }
+        self.reports[(window, today)] = report
+        return report
+
+movement_analytics = MovementAnalytics()
+
+def analytics_report(window, product_id=None, location_id=None, reorder_only=False, limit=None):
+    """Return ``(cells, total)``: the first ``limit`` matching cells by days of cover, and how many match.
+
+    Only cells with outflow in the window are reported. Each cell is a dict of ``ANALYTICS_FIELDS``.
+    """
+    today = epoch_day(datetime.utcnow())
+    with movement_analytics.lock:
+        movement_analytics.refresh(today - max(app.config['ANALYTICS_WINDOWS']) + 1)
+        report = movement_analytics.report(window, today)
+        keys = movement_analytics.keys
+    matches = np.ones(len(report['cell']), bool)
+    if reorder_only:
+        matches &= report['suggested_order'] > 0
+    if product_id or location_id:
+        matches &= np.fromiter(((not product_id or keys[cell][0] == product_id) and
+                                (not location_id or keys[cell][1] == location_id)
+                                for cell in report['cell']), bool, len(report['cell']))
+    positions = np.flatnonzero(matches)
+    cells = []
+    for position in positions[:limit]:
+        product, location = keys[report['cell'][position]]
+        turnover = report['turnover'][position]
+        cells.append({
+            'product_id': product,
+            'location_id': location,
+            'on_hand': int(report['on_hand'][position]),
+            'outflow': int(report['outflow'][position]),
+            'velocity': round(float(report['velocity'][position]), 2),
+            'days_of_cover': round(float(report['days_of_cover'][position]), 1),
+            'turnover': None if np.isnan(turnover) else round(float(turnover), 2),
+            'reorder_point': int(report['reorder_point'][position]),
+            'suggested_order': int(report['suggested_order'][position])
+        })
+    return add_balance_names(cells), len(positions)
+
+def analytics_window():
+    """Read ``?window=`` in days, or ``None`` if it is not one of ANALYTICS_WINDOWS."""
+    try:
+        window = int(request.args.get('window', app.config['ANALYTICS_DEFAULT_WINDOW']))
+    except ValueError:
+        return None
+    return window if window in app.config['ANALYTICS_WINDOWS'] else None
+
+# JSON API
+PRODUCT_API_FIELDS = ['product_id', 'name', 'description']
+MOVEMENT_API_FIELDS = MOVEMENT_EXPORT_FIELDS + ['opening']
+LOCATION_API_FIELDS = ['location_id', 'name', 'address']
+
+def api_fields(allowed):
+    """Return the fields named in ``?fields=a,b`` (all of ``allowed`` by default), aborting on unknown names."""
+    fields = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip()]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        abort(400, description=f'Unknown field(s): {", ".join(unknown)}')
+    return list(dict.fromkeys(fields)) or allowed
+
+def api_ids():
+    """Return the distinct IDs named in ``?ids=a,b`` for a batch lookup."""
+    ids = list(dict.fromkeys(item.strip() for item in request.args.get('ids', '').split(',') if item.strip()))
+    if len(ids) > app.config['MAX_PAGE_SIZE']:
+        abort(400, description=f'At most {app.config["MAX_PAGE_SIZE"]} ids per request')
+    return ids
+
+def api_record(item, fields):
+    record = {}
+    for field in fields:
+        value = item[field] if isinstance(item, dict) else getattr(item, field)
+        record[field] = value.isoformat() if isinstance(value, datetime) else value
+    return record
+
+def api_query(model, fields, key_columns):
+    """Query only the requested columns of ``model`` plus the key columns needed for paging."""
+    columns = [getattr(model, field) for field in fields]
+    return db.session.query(*columns, *[column for column in key_columns if column.key not in fields])
+
+def api_collection(query, fields, key_columns, descending=False):
+    """Serve an ``?ids=`` batch lookup or one keyset page of ``query`` as a JSON document."""
+    ids = api_ids()
+    if ids:
+        key = key_columns[-1]
+        found = {getattr(row, key.key): row for row in query.filter(key.in_(ids))}
+        return {
+            'data': [api_record(found[item_id], fields) for item_id in ids if item_id in found],
+            'missing': [item_id for item_id in ids if item_id not in found]
+        }
+    return api_page(paginate_keyset(query, key_columns, descending), fields)
+
+def api_page(page, fields):
+    return {
+        'data': [api_record(row, fields) for row in page.items],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+        'per_page': page.per_page
+    }
+
+def api_item(query, fields, key_column, item_id):
+    row = query.filter(key_column == item_id).first()
+    if row is None:
+        abort(404, description=f'{item_id} not found')
+    return {'data': api_record(row, fields)}
+
+def versioned_json(tables, build):
+    """Return ``build()`` as JSON tagged with an ETag and Last-Modified from the change counters of ``tables``.
+
+    A client whose If-None-Match (or, without one, If-Modified-Since) still matches gets
+    an empty 304 and ``build`` is never called. The counters are read before the body is
+    built, so a write landing in between makes the next poll refetch instead of hiding it.
+    """
+    etag, last_modified = table_versions(tables)
+    fresh = False
+    if etag is not None:
+        if request.if_none_match:
+            fresh = request.if_none_match.contains(etag)
+        elif request.if_modified_since is not None:
+            fresh = last_modified <= request.if_modified_since
+    response = Response(status=304) if fresh else jsonify(build())
+    if etag is not None:
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.cache_control.no_cache = True
+    return response
+
+@app.errorhandler(HTTPException)
+def handle_http_error(error):
+    """Report errors under /api/ as JSON; the HTML pages keep Flask's default error pages."""
+    if not request.path.startswith('/api/'):
+        return error
+    return jsonify(error={'code': error.code, 'name': error.name, 'description': error.description}), error.code
+
+# Live Updates
+# Movement writes are published to every /events stream open in this process as server-sent
+# events carrying the movement and the new stock level of each cell it changed. Pages with a
+# data-live table patch themselves from these instead of being reloaded. Bulk imports and
+# bulk deletes publish a single "reload" event instead. Events carry the ledger's change
+# counter so clients can skip any that arrive after a newer one. Each open stream holds a
+# server thread, so at most EVENT_STREAM_MAX_CLIENTS are served at once and each is closed
+# after EVENT_STREAM_TIMEOUT seconds; browsers reconnect and resume from the last event id.
+LiveEvent = namedtuple('LiveEvent', ['id', 'type', 'data'])
+
+class Subscription:
+    """One open event stream: a bounded queue, flagged instead of blocking the publisher when full."""
+
+    def __init__(self, size):
+        self.queue = Queue(size)
+        self.overflowed = False
+
+class EventBroker:
+    """Fans events out to subscriptions, keeping the latest so a reconnecting stream can resume."""
+
+    def __init__(self, backlog):
+        self.subscriptions = set()
+        self.recent = deque(maxlen=backlog)
+        self.last_id = 0
+        self.published = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def publish(self, type, data):
+        if data is None:
+            return
+        with self.lock:
+            self.last_id += 1
+            self.published += 1
+            event = LiveEvent(self.last_id, type, json.dumps(data))
+            self.recent.append(event)
+            for subscription in self.subscriptions:
+                try:
+                    subscription.queue.put_nowait(event)
+                except Full:
+                    subscription.overflowed = True
+
+    def subscribe(self, after, max_clients, queue_size):
+        """Return ``(subscription, missed)`` for a stream resuming after event ``after``.
+
+        ``missed`` is the list of retained events since then, or ``None`` if some were
+        dropped (or ``after`` is from before a restart) and the client should reload.
+        The subscription is ``None`` when ``max_clients`` streams are already open.
+        """
+        with self.lock:
+            if len(self.subscriptions) >= max_clients:
+                self.rejected += 1
+                return None, None
+            subscription = Subscription(queue_size)
+            self.subscriptions.add(subscription)
+            if after is None or after == self.last_id:
+                return subscription, []
+            if after > self.last_id or (self.recent and after < self.recent[0].id - 1):
+                return subscription, None
+            return subscription, [event for event in self.recent if event.id > after]
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+event_broker = EventBroker(app.config['EVENT_BACKLOG'])
+
+def movement_event(action, movement_id, movement=None, new=None, old=None):
+    """Describe a movement write for the event stream, from inside its transaction before the commit.
+
+    ``new`` and ``old`` are the postings passed to ``post_stock``; the event lists each cell
+    they change with its delta and its stock level after the write. Returns ``None``, without
+    touching the database, when no stream is open.
+    """
+    if not event_broker.subscriptions:
+        return None
+    deltas = {key: delta for key, delta in posting_deltas(new, old).items() if delta}
+    levels = dict(((row[0], row[1]), row[2]) for row in db.session.execute(
+        db.select(StockLevel.product_id, StockLevel.location_id, StockLevel.qty).where(
+            db.tuple_(StockLevel.product_id, StockLevel.location_id).in_(list(deltas))))) if deltas else {}
+    data = {'action': action, 'version': ledger_version(), 'movement': {'movement_id': movement_id}}
+    if movement is not None:
+        data['movement'] = dict(api_record(movement, MOVEMENT_API_FIELDS),
+                                product_name=movement.product.name,
+                                from_name=movement.from_loc.name if movement.from_loc else None,
+                                to_name=movement.to_loc.name if movement.to_loc else None)
+    data['balances'] = add_balance_names([
+        {'product_id': product_id, 'location_id': location_id, 'delta': delta,
+         'balance': levels.get((product_id, location_id), 0)}
+        for (product_id, location_id), delta in sorted(deltas.items())
+    ])
+    return data
+
+def format_event(event):
+    return f'id: {event.id}\nevent: {event.type}\ndata: {event.data}\n\n'
+
+def event_stream(subscription, missed):
+    """Yield server-sent events for ``subscription`` until the client goes or the stream times out."""
+    try:
+        yield f'retry: {app.config["EVENT_STREAM_RETRY_MS"]}\n\n'
+        if missed is None:
+            yield 'event: reload\ndata: {}\n\n'
+            return
+        for event in missed:
+            yield format_event(event)
+        deadline = time.monotonic() + app.config['EVENT_STREAM_TIMEOUT']
+        while time.monotonic() < deadline:
+            if subscription.overflowed:
+                # The client fell too far behind to patch its page, so it starts again
+                yield 'event: reload\ndata: {}\n\n'
+                return
+            try:
+                event = subscription.queue.get(timeout=app.config['EVENT_STREAM_KEEPALIVE'])
+            except Empty:
+                # A comment line keeps proxies from timing the stream out and finds closed sockets
+                yield ': keepalive\n\n'
+                continue
+            yield format_event(event)
+    finally:
+        event_broker.unsubscribe(subscription)
+
+@app.before_request
+def note_event_position():
+    # Taken before the page reads anything, so a stream opened from it misses no write
+    g.live_event_id = event_broker.last_id
+
+@app.context_processor
+def live_event_position():
+    return {'live_event_id': g.get('live_event_id')}
+
+# Instrumentation
+# Query count, SQL time, template render time and response size per request, gathered from
+# SQLAlchemy cursor events and Flask request hooks and totalled per endpoint in this process.
+# Totals are served by /metrics in the Prometheus text format and summarised by /performance.
+# A statement repeated N_PLUS_ONE_THRESHOLD times in one request is flagged as a likely N+1;
+# lazy relationship loads are named after the relationship (e.g. ProductMovement.product).
+REQUEST_DURATION_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+class RequestStats:
+    """Counters for the request being served, kept on ``g``."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.status = 500
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.template_started = None
+        self.response_bytes = 0
+        self.statements = defaultdict(int)
+
+class RouteMetrics:
+    """Running totals for one endpoint."""
+
+    def __init__(self):
+        self.requests = defaultdict(int)
+        self.buckets = [0] * len(REQUEST_DURATION_BUCKETS)
+        self.seconds = 0.0
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.response_bytes = 0
+        self.n_plus_one = 0
+        self.recent = deque(maxlen=app.config['METRICS_SAMPLE_SIZE'])
+        self.suspects = {}
+
+route_metrics = {}
+route_metrics_lock = threading.Lock()
+
+def request_stats():
+    return g.get('request_stats') if has_request_context() else None
+
+@db.event.listens_for(Session, 'do_orm_execute')
+def tag_relationship_load(orm_execute_state):
+    """Label lazy loads with the relationship they load, so the N+1 report can name it."""
+    if orm_execute_state.is_relationship_load and orm_execute_state.loader_strategy_path is not None:
+        orm_execute_state.update_execution_options(relationship_load=str(orm_execute_state.loader_strategy_path[-1]))
+
+@db.event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_started'] = time.perf_counter()
+
+@db.event.listens_for(Engine, 'after_cursor_execute')
+def record_query(conn, cursor, statement, parameters, context, executemany):
+    stats = request_stats()
+    if stats is None:
+        return
+    stats.queries += 1
+    stats.sql_seconds += time.perf_counter() - conn.info.pop('query_started', time.perf_counter())
+    label = context.execution_options.get('relationship_load') if context is not None else None
+    if label:
+        stats.statements[f'lazy load of {label}'] += 1
+    elif statement.lstrip()[:6].upper() == 'SELECT':
+        stats.statements[' '.join(statement.split())] += 1
+
+@before_render_template.connect_via(app)
+def start_template_timer(sender, template, context, **extra):
+    stats = request_stats()
+    if stats is not None:
+        stats.template_started = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def record_template(sender, template, context, **extra):
+    stats = request_stats()
+    if stats is not None and stats.template_started is not None:
+        stats.template_seconds += time.perf_counter() - stats.template_started
+        stats.template_started = None
+
+def count_response_bytes(body, stats):
+    """Pass a streamed body through, adding the size of each chunk to ``stats``."""
+    try:
+        for chunk in body:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            stats.response_bytes += len(chunk)
+            yield chunk
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+
+@app.before_request
+def start_request_stats():
+    g.request_stats = RequestStats()
+
+@app.after_request
+def add_timing_headers(response):
+    """Report the work done so far in a Server-Timing header; streamed bodies are measured as they are sent."""
+    stats = g.get('request_stats')
+    if stats is None:
+        return response
+    stats.status = response.status_code
+    elapsed = time.perf_counter() - stats.started
+    response.headers['Server-Timing'] = (
+        f'sql;dur={stats.sql_seconds * 1000:.1f};desc="{stats.queries} queries", '
+        f'template;dur={stats.template_seconds * 1000:.1f}, total;dur={elapsed * 1000:.1f}'
+    )
+    response.headers['X-Query-Count'] = str(stats.queries)
+    if response.is_streamed:
+        response.response = count_response_bytes(response.response, stats)
+    else:
+        stats.response_bytes = response.content_length or 0
+    return response
+
+@app.teardown_request
+def record_request_stats(error=None):
+    """Fold the finished request into its endpoint's totals and log any N+1 suspects.
+
+    Streamed responses (exports) keep the request context until the body is sent, so
+    their SQL time and size cover the whole stream.
+    """
+    stats = g.pop('request_stats', None)
+    if stats is None:
+        return
+    elapsed = time.perf_counter() - stats.started
+    endpoint = request.endpoint or 'unmatched'
+    threshold = app.config['N_PLUS_ONE_THRESHOLD']
+    suspects = {statement: count for statement, count in stats.statements.items() if count >= threshold}
+    with route_metrics_lock:
+        route = route_metrics.get(endpoint)
+        if route is None:
+            route = route_metrics[endpoint] = RouteMetrics()
+        route.requests[(request.method, stats.status)] += 1
+        for index, bound in enumerate(REQUEST_DURATION_BUCKETS):
+            if elapsed <= bound:
+                route.buckets[index] += 1
+        route.seconds += elapsed
+        route.queries += stats.queries
+        route.sql_seconds += stats.sql_seconds
+        route.template_seconds += stats.template_seconds
+        route.response_bytes += stats.response_bytes
+        route.recent.append(elapsed)
+        if suspects:
+            route.n_plus_one += 1
+            for statement, count in suspects.items():
+                route.suspects[statement] = max(count, route.suspects.get(statement, 0))
+    for statement, count in suspects.items():
+        app.logger.warning('Possible N+1 query in %s: %d x %s', endpoint, count, statement[:200])
+
+def route_report():
+    """Return one summary dict per endpoint, slowest total time first."""
+    with route_metrics_lock:
+        routes = [(endpoint, route, sorted(route.recent)) for endpoint, route in route_metrics.items()]
+        report = []
+        for endpoint, route, recent in routes:
+            count = sum(route.requests.values())
+            report.append({
+                'endpoint': endpoint,
+                'requests': count,
+                'total_ms': route.seconds * 1000,
+                'mean_ms': route.seconds * 1000 / count,
+                'p95_ms': recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000,
+                'queries': route.queries / count,
+                'sql_ms': route.sql_seconds * 1000 / count,
+                'template_ms': route.template_seconds * 1000 / count,
+                'response_kb': route.response_bytes / 1024 / count,
+                'n_plus_one': route.n_plus_one,
+                'suspects': sorted(route.suspects.items(), key=lambda item: -item[1])
+            })
+    return sorted(report, key=lambda row: -row['total_ms'])
+
+def prometheus_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def prometheus_metrics():
+    """Render the per-endpoint totals in the Prometheus text exposition format."""
+    families = [
+        ('inventory_sql_queries_total', 'SQL statements executed', lambda route: route.queries),
+        ('inventory_sql_seconds_total', 'Time spent executing SQL', lambda route: route.sql_seconds),
+        ('inventory_template_seconds_total', 'Time spent rendering templates', lambda route: route.template_seconds),
+        ('inventory_response_bytes_total', 'Response body bytes sent', lambda route: route.response_bytes),
+        ('inventory_n_plus_one_requests_total', 'Requests that repeated a query N_PLUS_ONE_THRESHOLD times',
+         lambda route: route.n_plus_one),
+    ]
+    with route_metrics_lock:
+        routes = sorted(route_metrics.items())
+        lines = ['# HELP inventory_http_requests_total HTTP requests served',
+                 '# TYPE inventory_http_requests_total counter']
+        for endpoint, route in routes:
+            for (method, status), count in sorted(route.requests.items()):
+                lines.append(f'inventory_http_requests_total{{endpoint="{prometheus_label(endpoint)}",'
+                             f'method="{method}",status="{status}"}} {count}')
+        lines += ['# HELP inventory_http_request_duration_seconds Time to serve a request',
+                  '# TYPE inventory_http_request_duration_seconds histogram']
+        for endpoint, route in routes:
+            label = f'endpoint="{prometheus_label(endpoint)}"'
+            for bound, count in zip(REQUEST_DURATION_BUCKETS, route.buckets):
+                lines.append(f'inventory_http_request_duration_seconds_bucket{{{label},le="{bound}"}} {count}')
+            count = sum(route.requests.values())
+            lines.append(f'inventory_http_request_duration_seconds_bucket{{{label},le="+Inf"}} {count}')
+            lines.append(f'inventory_http_request_duration_seconds_sum{{{label}}} {route.seconds}')
+            lines.append(f'inventory_http_request_duration_seconds_count{{{label}}} {count}')
+        for name, help_text, value in families:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            for endpoint, route in routes:
+                lines.append(f'{name}{{endpoint="{prometheus_label(endpoint)}"}} {value(route)}')
+    with page_cache.lock:
+        lines += [
+            '# HELP inventory_page_cache_requests_total Page cache lookups by result',
+            '# TYPE inventory_page_cache_requests_total counter',
+            f'inventory_page_cache_requests_total{{result="hit"}} {page_cache.hits}',
+            f'inventory_page_cache_requests_total{{result="miss"}} {page_cache.misses}',
+            '# HELP inventory_page_cache_evictions_total Pages evicted to stay under PAGE_CACHE_MAX_BYTES',
+            '# TYPE inventory_page_cache_evictions_total counter',
+            f'inventory_page_cache_evictions_total {page_cache.evictions}',
+            '# HELP inventory_page_cache_bytes Size of the cached page bodies',
+            '# TYPE inventory_page_cache_bytes gauge',
+            f'inventory_page_cache_bytes {page_cache.size}',
+            '# HELP inventory_page_cache_entries Pages in the cache',
+            '# TYPE inventory_page_cache_entries gauge',
+            f'inventory_page_cache_entries {len(page_cache.entries)}',
+        ]
+    with event_broker.lock:
+        lines += [
+            '# HELP inventory_events_published_total Events published to the /events streams',
+            '# TYPE inventory_events_published_total counter',
+            f'inventory_events_published_total {event_broker.published}',
+            '# HELP inventory_event_streams_rejected_total Streams refused at EVENT_STREAM_MAX_CLIENTS',
+            '# TYPE inventory_event_streams_rejected_total counter',
+            f'inventory_event_streams_rejected_total {event_broker.rejected}',
+            '# HELP inventory_event_streams Open /events streams',
+            '# TYPE inventory_event_streams gauge',
+            f'inventory_event_streams {len(event_broker.subscriptions)}',
+        ]
+    return '\n'.join(lines) + '\n'
+
+# Schema Migrations
+# New tables are created by db.create_all(); migrations cover everything it cannot do
+# for an existing database, such as indexes on old tables and backfilling derived data.
+# Append new steps with the next version number and never renumber existing ones.
+def migrate_stock_levels(connection):
+    rebuild_stock_levels()
+
+def migrate_movement_indexes(connection):
+    for index in ProductMovement.__table__.indexes:
+        index.create(bind=connection, checkfirst=True)
+
+def migrate_search_suspend(connection):
+    if connection.dialect.name != 'sqlite':
+        return
+    connection.exec_driver_sql('DROP TRIGGER IF EXISTS movement_search_insert')
+    for statement in SEARCH_DDL:
+        connection.exec_driver_sql(statement)
+
+def migrate_change_counters(connection):
+    create_change_counters(db.metadata, connection)
+
+def migrate_opening_movements(connection):
+    columns = {column['name'] for column in db.inspect(connection).get_columns('product_movement')}
+    if 'opening' not in columns:
+        connection.exec_driver_sql('ALTER TABLE product_movement ADD COLUMN opening BOOLEAN NOT NULL DEFAULT 0')
+
+def migrate_row_counters(connection):
+    if connection.dialect.name != 'sqlite':
+        return
+    columns = {column['name'] for column in db.inspect(connection).get_columns('table_version')}
+    if 'row_count' not in columns:
+        connection.exec_driver_sql('ALTER TABLE table_version ADD COLUMN row_count INTEGER NOT NULL DEFAULT 0')
+    for table in VERSIONED_TABLES:
+        for event in ROW_COUNT_CHANGE:
+            connection.exec_driver_sql(f'DROP TRIGGER IF EXISTS {table}_version_{event}')
+        connection.exec_driver_sql(f"UPDATE table_version SET row_count = (SELECT COUNT(*) FROM {table}) "
+                                   f"WHERE table_name = '{table}'")
+    create_change_counters(db.metadata, connection)
+
+MIGRATIONS = [
+    (1, 'backfill stock levels', migrate_stock_levels),
+    (2, 'movement ledger indexes', migrate_movement_indexes),
+    (3, 'suspendable movement search trigger', migrate_search_suspend),
+    (4, 'table change counters', migrate_change_counters),
+    (5, 'opening balance movements', migrate_opening_movements),
+    (6, 'table row counters', migrate_row_counters),
+]
+
+def upgrade_database():
+    """Bring the database schema up to date in place and return the migrations applied."""
+    db.create_all()
+    applied = {row.version for row in SchemaMigration.query}
+    names = []
+    for version, name, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        migrate(db.session.connection())
+        db.session.add(SchemaMigration(version=version, name=name))
+        db.session.commit()
+        names.append(name)
+    return names
+
+def hot_query_plans():
+    """Return ``(name, statement, required index)`` for the app's hottest ledger queries."""
+    latest = db.select(ProductMovement).order_by(
+        ProductMovement.timestamp.desc(), ProductMovement.movement_id.desc()
+    ).limit(50)
+    return [
+        ('balance by product', ledger_totals(product_id='P001'), 'ix_product_movement_product_'),
+        ('balance by location', ledger_totals(location_id='L001'), '_location'),
+        ('balance replay window', ledger_totals(after=datetime(2024, 1, 1), until=datetime(2024, 2, 1)),
+         'ix_product_movement_timestamp'),
+        ('movements listing', latest, 'ix_product_movement_timestamp'),
+        ('movements next page', latest.where(db.tuple_(ProductMovement.timestamp, ProductMovement.movement_id)
+                                             < (datetime(2024, 1, 1), 'M001')), 'ix_product_movement_timestamp'),
+        ('product delete guard', db.select(ProductMovement.movement_id).where(
+            ProductMovement.product_id == 'P001').limit(1), 'ix_product_movement_product_'),
+        ('location delete guard', db.select(ProductMovement.movement_id).where(
+            ProductMovement.to_location == 'L001').limit(1), 'ix_product_movement_to_location'),
+    ]
+
+def check_query_plans():
+    """Run EXPLAIN QUERY PLAN on each hot query and return those missing their index."""
+    if db.engine.dialect.name != 'sqlite':
+        return []
+    failures = []
+    connection = db.session.connection()
+    for name, statement, index in hot_query_plans():
+        compiled = statement.compile(dialect=db.engine.dialect)
+        params = tuple(compiled.params[key] for key in compiled.positiontup)
+        plan = [row[-1] for row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}', params)]
+        full_scans = [step for step in plan if step.startswith('SCAN product_movement') and 'INDEX' not in step]
+        if full_scans or not any(index in step for step in plan if 'product_movement' in step):
+            failures.append((name, plan))
+    return failures
+
+@app.cli.command('upgrade-db')
+def upgrade_db_command():
+    """Create missing tables and apply pending schema migrations."""
+    names = upgrade_database()
+    for name in names:
+        print(f"[OK] Applied migration: {name}")
+    print(f"[OK] Database is up to date ({len(names)} migration(s) applied)")
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Verify that the hot ledger queries are served by indexes."""
+    failures = check_query_plans()
+    for name, plan in failures:
+        print(f"[ERROR] {name} does not use its index:")
+        for step in plan:
+            print(f"    {step}")
+    if failures:
+        raise SystemExit(1)
+    print("[OK] All hot queries use their indexes")
 
 # Routes
 @app.route('/')
+@cached_page(['location', 'product', 'product_movement'])
 def index():
-    products_count = Product.query.count()
-    locations_count = Location.query.count()
-    movements_count = ProductMovement.query.count()
+    counts = table_row_counts(['location', 'product', 'product_movement'])
+    if counts is None:
+        counts = {
+            'product': Product.query.count(),
+            'location': Location.query.count(),
+            'product_movement': ProductMovement.query.count()
+        }
     return render_template('index.html', 
-                         products_count=products_count,
-                         locations_count=locations_count,
-                         movements_count=movements_count)
+                         products_count=counts['product'],
+                         locations_count=counts['location'],
+                         movements_count=counts['product_movement'])
 
 @app.route('/products')
+@cached_page(['product'])
 def products():
     search_query = request.args.get('search', '').strip()
+    if search_query and search_index_enabled():
+        page = search_page(Product.query, Product.product_id, 'product_search', search_query)
+        return render_template('products.html', products=page.items, page=page, search_query=search_query)
     if search_query:
-        products = Product.query.filter(
+        query = Product.query.filter(
             (Product.product_id.contains(search_query)) |
             (Product.name.contains(search_query)) |
             (Product.description.contains(search_query))
-        ).all()
+        )
     else:
-        products = Product.query.all()
-    return render_template('products.html', products=products, search_query=search_query)
+        query = Product.query
+    page = paginate_keyset(query, [Product.product_id])
+    return render_template('products.html', products=page.items, page=page, search_query=search_query)
 
 @app.route('/products/add', methods=['GET', 'POST'])
 def add_product():
@@ -135,9 +2349,9 @@ def delete_product(product_id):
     product = Product.query.get_or_404(product_id)
     
     # Check if there are any movements referencing this product
-    movements = ProductMovement.query.filter_by(product_id=product_id).all()
-    if movements:
-        flash(f'Cannot delete product "{product.name}" because it has {len(movements)} movement(s) associated with it. Please delete the movements first.', 'error')
+    total_movements = movement_references(product_id=product_id)
+    if total_movements:
+        flash(f'Cannot delete product "{product.name}" because it has {total_movements} movement(s) associated with it. Please delete the movements first.', 'error')
         return redirect(url_for('products'))
     
     db.session.delete(product)
@@ -146,17 +2360,22 @@ def delete_product(product_id):
     return redirect(url_for('products'))
 
 @app.route('/locations')
+@cached_page(['location'])
 def locations():
     search_query = request.args.get('search', '').strip()
+    if search_query and search_index_enabled():
+        page = search_page(Location.query, Location.location_id, 'location_search', search_query)
+        return render_template('locations.html', locations=page.items, page=page, search_query=search_query)
     if search_query:
-        locations = Location.query.filter(
+        query = Location.query.filter(
             (Location.location_id.contains(search_query)) |
             (Location.name.contains(search_query)) |
             (Location.address.contains(search_query))
-        ).all()
+        )
     else:
-        locations = Location.query.all()
-    return render_template('locations.html', locations=locations, search_query=search_query)
+        query = Location.query
+    page = paginate_keyset(query, [Location.location_id])
+    return render_template('locations.html', locations=page.items, page=page, search_query=search_query)
 
 @app.route('/locations/add', methods=['GET', 'POST'])
 def add_location():
@@ -190,9 +2409,7 @@ def delete_location(location_id):
     location = Location.query.get_or_404(location_id)
     
     # Check if there are any movements referencing this location
-    from_movements = ProductMovement.query.filter_by(from_location=location_id).all()
-    to_movements = ProductMovement.query.filter_by(to_location=location_id).all()
-    total_movements = len(from_movements) + len(to_movements)
+    total_movements = movement_references(location_id=location_id)
     
     if total_movements > 0:
         flash(f'Cannot delete location "{location.name}" because it has {total_movements} movement(s) associated with it. Please delete the movements first.', 'error')
@@ -206,8 +2423,20 @@ def delete_location(location_id):
 @app.route('/movements')
 def movements():
     search_query = request.args.get('search', '').strip()
+    # Read before the page so a write landing in between is replayed by the event stream
+    live_version = ledger_version()
+    # Load product and location names in the same query instead of once per row
+    query = ProductMovement.query.options(
+        db.joinedload(ProductMovement.product),
+        db.joinedload(ProductMovement.from_loc),
+        db.joinedload(ProductMovement.to_loc)
+    )
+    if search_query and search_index_enabled():
+        page = search_page(query, ProductMovement.movement_id, 'movement_search', search_query)
+        return render_template('movements.html', movements=page.items, page=page, search_query=search_query,
+                               live_version=live_version)
     if search_query:
-        movements = ProductMovement.query.join(Product).join(Location, 
+        query = query.join(Product).join(Location, 
             (ProductMovement.from_location == Location.location_id) | 
             (ProductMovement.to_location == Location.location_id)
         ).filter(
@@ -216,22 +2445,40 @@ def movements():
             (Product.name.contains(search_query)) |
             (Location.location_id.contains(search_query)) |
             (Location.name.contains(search_query))
-        ).order_by(ProductMovement.timestamp.desc()).all()
-    else:
-        movements = ProductMovement.query.order_by(ProductMovement.timestamp.desc()).all()
-    return render_template('movements.html', movements=movements, search_query=search_query)
+        )
+    page = paginate_keyset(query, [ProductMovement.timestamp, ProductMovement.movement_id], descending=True)
+    return render_template('movements.html', movements=page.items, page=page, search_query=search_query,
+                           live_version=live_version)
+
+@app.route('/movements/import', methods=['GET', 'POST'])
+def import_movements_upload():
+    form = MovementImportForm()
+    result = None
+    if form.validate_on_submit():
+        upload = form.file.data
+        fmt = form.format.data or detect_import_format(upload.filename or '')
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        result = import_movements(stream, fmt, form.batch_size.data)
+        if result.imported:
+            event_broker.publish('reload', {'reason': 'import'})
+        if result.errors:
+            flash(f'Imported {result.imported} movement(s); {len(result.errors)} row(s) were skipped.', 'warning')
+        else:
+            flash(f'Imported {result.imported} movement(s) successfully!', 'success')
+    return render_template('movement_import.html', form=form, result=result)
 
 @app.route('/movements/add', methods=['GET', 'POST'])
 def add_movement():
+    form = MovementForm()
+    
     # Check if there are products and locations
-    if Product.query.count() == 0:
+    if not form.movement_choices.products:
         flash('Please add some products before creating movements.', 'error')
         return redirect(url_for('add_product'))
-    if Location.query.count() == 0:
+    if not form.movement_choices.locations:
         flash('Please add some locations before creating movements.', 'error')
         return redirect(url_for('add_location'))
     
-    form = MovementForm()
     if form.validate_on_submit():
         # Validate that at least one location is selected
         if not form.from_location.data and not form.to_location.data:
@@ -245,8 +2492,19 @@ def add_movement():
             to_location=form.to_location.data if form.to_location.data else None,
             qty=form.qty.data
         )
+        posting = MovementPosting(movement.product_id, movement.from_location, movement.to_location,
+                                  movement.qty, None)
+        begin_immediate()
         db.session.add(movement)
+        try:
+            post_stock(new=posting)
+        except InsufficientStockError as e:
+            db.session.rollback()
+            flash(str(e), 'error')
+            return render_template('movement_form.html', form=form, title='Add Movement')
+        event = movement_event('create', movement.movement_id, movement, new=posting)
         db.session.commit()
+        event_broker.publish('movement', event)
         flash('Movement added successfully!', 'success')
         return redirect(url_for('movements'))
     return render_template('movement_form.html', form=form, title='Add Movement')
@@ -260,70 +2518,261 @@ def edit_movement(movement_id):
             flash('Please select at least one location (from or to)', 'error')
             return render_template('movement_form.html', form=form, title='Edit Movement')
         
+        # Re-read the movement under the write lock, then swap its old posting for the new one
+        begin_immediate()
+        db.session.refresh(movement)
+        old = movement_posting(movement)
         movement.product_id = form.product_id.data
         movement.from_location = form.from_location.data if form.from_location.data else None
         movement.to_location = form.to_location.data if form.to_location.data else None
         movement.qty = form.qty.data
+        new = movement_posting(movement)
+        try:
+            post_stock(new=new, old=old)
+        except InsufficientStockError as e:
+            db.session.rollback()
+            flash(str(e), 'error')
+            return render_template('movement_form.html', form=form, title='Edit Movement')
+        event = movement_event('update', movement_id, movement, new=new, old=old)
         db.session.commit()
+        event_broker.publish('movement', event)
         flash('Movement updated successfully!', 'success')
         return redirect(url_for('movements'))
     return render_template('movement_form.html', form=form, title='Edit Movement')
 
 @app.route('/movements/delete/<movement_id>')
 def delete_movement(movement_id):
+    begin_immediate()
     movement = ProductMovement.query.get_or_404(movement_id)
+    old = movement_posting(movement)
+    try:
+        post_stock(old=old)
+    except InsufficientStockError as e:
+        db.session.rollback()
+        flash(f'Cannot delete movement {movement_id}: {e}', 'error')
+        return redirect(url_for('movements'))
     db.session.delete(movement)
+    event = movement_event('delete', movement_id, old=old)
     db.session.commit()
+    event_broker.publish('movement', event)
     flash('Movement deleted successfully!', 'success')
     return redirect(url_for('movements'))
 
 @app.route('/movements/delete-all')
 def delete_all_movements():
-    movements = ProductMovement.query.all()
-    count = len(movements)
-    
-    for movement in movements:
-        db.session.delete(movement)
-    
-    db.session.commit()
-    flash(f'Successfully deleted {count} movements. You can now delete products and locations.', 'success')
+    start, end, product_id, location_id = filter_args()
+    count, error = delete_movements(start, end, product_id, location_id)
+    if count:
+        event_broker.publish('reload', {'reason': 'delete'})
+    if error:
+        flash(error, 'error')
+    elif any([start, end, product_id, location_id]):
+        flash(f'Successfully deleted {count} matching movements.', 'success')
+    else:
+        flash(f'Successfully deleted {count} movements. You can now delete products and locations.', 'success')
     return redirect(url_for('movements'))
 
 @app.route('/balance')
+@cached_page(['location', 'product', 'product_movement', 'stock_level'])
 def balance():
-    # Get all products and locations
-    products = Product.query.all()
-    locations = Location.query.all()
+    product_filter = request.args.get('product_id', '').strip()
+    location_filter = request.args.get('location_id', '').strip()
+    as_of_param = request.args.get('as_of', '').strip()
+    live_version = ledger_version()
+    
+    as_of = None
+    if as_of_param:
+        try:
+            as_of = parse_timestamp(as_of_param, end_of_day=True)
+        except ValueError:
+            flash(f'Invalid date "{as_of_param}". Use YYYY-MM-DD or YYYY-MM-DDTHH:MM.', 'error')
+            as_of_param = ''
+    
+    if as_of is not None:
+        balance_data = add_balance_names(balances_as_of(as_of, product_filter, location_filter))
+    else:
+        balance_data = compute_balances(product_filter, location_filter)
+    
+    # Only show locations with positive balance
+    balance_data = [item for item in balance_data if item['balance'] > 0]
     
-    # Calculate balance for each product in each location
-    balance_data = []
-    for product in products:
-        for location in locations:
-            # Calculate incoming quantity (to_location = this location)
-            incoming = db.session.query(db.func.sum(ProductMovement.qty)).filter(
-                ProductMovement.to_location == location.location_id,
-                ProductMovement.product_id == product.product_id
-            ).scalar() or 0
-            
-            # Calculate outgoing quantity (from_location = this location)
-            outgoing = db.session.query(db.func.sum(ProductMovement.qty)).filter(
-                ProductMovement.from_location == location.location_id,
-                ProductMovement.product_id == product.product_id
-            ).scalar() or 0
-            
-            balance = incoming - outgoing
-            if balance > 0:  # Only show locations with positive balance
-                balance_data.append({
-                    'product_id': product.product_id,
-                    'product_name': product.name,
-                    'location_id': location.location_id,
-                    'location_name': location.name,
-                    'balance': balance
-                })
+    return render_template('balance.html', balance_data=balance_data, as_of=as_of_param, live_version=live_version)
+
+@app.route('/analytics')
+def analytics():
+    window = analytics_window()
+    if window is None:
+        flash(f'Window must be one of {", ".join(map(str, app.config["ANALYTICS_WINDOWS"]))} days.', 'error')
+        window = app.config['ANALYTICS_DEFAULT_WINDOW']
+    cells, total = analytics_report(
+        window,
+        request.args.get('product_id', '').strip(),
+        request.args.get('location_id', '').strip(),
+        reorder_only=bool(request.args.get('reorder')),
+        limit=app.config['ANALYTICS_REPORT_LIMIT']
+    )
+    return render_template('analytics.html', cells=cells, total=total, window=window,
+                           windows=app.config['ANALYTICS_WINDOWS'],
+                           lead_time=app.config['ANALYTICS_LEAD_TIME_DAYS'],
+                           order_days=app.config['ANALYTICS_ORDER_DAYS'])
+
+@app.route('/export/movements')
+def export_movements():
+    fmt, start, end, product_id, location_id = export_args()
+    rows = iter_query_rows(movement_export_query(start, end, product_id, location_id))
+    return export_response(iter_export(rows, MOVEMENT_EXPORT_FIELDS, fmt), 'movements', fmt)
+
+@app.route('/export/archive')
+def export_archive():
+    fmt, start, end, product_id, location_id = export_args()
+    rows = archived_movements(start, end, product_id, location_id)
+    return export_response(iter_export(rows, MOVEMENT_EXPORT_FIELDS, fmt), 'archived_movements', fmt)
+
+@app.route('/export/balance')
+def export_balance():
+    fmt, _, _, product_id, location_id = export_args()
+    try:
+        as_of = parse_timestamp(request.args['as_of'], end_of_day=True) if request.args.get('as_of') else None
+    except ValueError:
+        abort(400, description='Dates must be YYYY-MM-DD or YYYY-MM-DDTHH:MM')
+    if as_of is not None:
+        # Point-in-time balances come from a snapshot plus replay, so they are built in memory
+        rows = ([item[field] for field in BALANCE_EXPORT_FIELDS]
+                for item in add_balance_names(balances_as_of(as_of, product_id, location_id)))
+    else:
+        rows = iter_query_rows(balance_export_query(product_id, location_id))
+    return export_response(iter_export(rows, BALANCE_EXPORT_FIELDS, fmt), 'balance', fmt)
+
+@app.route('/api/v1/products')
+def api_products():
+    fields = api_fields(PRODUCT_API_FIELDS)
+    key_columns = [Product.product_id]
+    return versioned_json(['product'], lambda: api_collection(
+        api_query(Product, fields, key_columns), fields, key_columns))
+
+@app.route('/api/v1/products/<product_id>')
+def api_product(product_id):
+    fields = api_fields(PRODUCT_API_FIELDS)
+    return versioned_json(['product'], lambda: api_item(
+        api_query(Product, fields, [Product.product_id]), fields, Product.product_id, product_id))
+
+@app.route('/api/v1/locations')
+def api_locations():
+    fields = api_fields(LOCATION_API_FIELDS)
+    key_columns = [Location.location_id]
+    return versioned_json(['location'], lambda: api_collection(
+        api_query(Location, fields, key_columns), fields, key_columns))
+
+@app.route('/api/v1/locations/<location_id>')
+def api_location(location_id):
+    fields = api_fields(LOCATION_API_FIELDS)
+    return versioned_json(['location'], lambda: api_item(
+        api_query(Location, fields, [Location.location_id]), fields, Location.location_id, location_id))
+
+@app.route('/api/v1/movements')
+def api_movements():
+    fields = api_fields(MOVEMENT_API_FIELDS)
+    start, end, product_id, location_id = filter_args()
+    key_columns = [ProductMovement.timestamp, ProductMovement.movement_id]
+    query = filter_movements(api_query(ProductMovement, fields, key_columns), start, end, product_id, location_id)
+    return versioned_json(['product_movement'], lambda: api_collection(query, fields, key_columns, descending=True))
+
+@app.route('/api/v1/movements/<movement_id>')
+def api_movement(movement_id):
+    fields = api_fields(MOVEMENT_API_FIELDS)
+    query = api_query(ProductMovement, fields, [ProductMovement.movement_id])
+    return versioned_json(['product_movement'], lambda: api_item(
+        query, fields, ProductMovement.movement_id, movement_id))
+
+@app.route('/api/v1/typeahead/products')
+def api_product_typeahead():
+    text = request.args.get('q', '').strip()
+    return versioned_json(['product'], lambda: {'data': [
+        api_record(row, ['product_id', 'name'])
+        for row in product_typeahead(text, app.config['TYPEAHEAD_LIMIT'])
+    ]})
+
+@app.route('/api/v1/balance')
+def api_balance():
+    fields = api_fields(BALANCE_EXPORT_FIELDS)
+    product_id = request.args.get('product_id', '').strip()
+    location_id = request.args.get('location_id', '').strip()
+    try:
+        as_of = parse_timestamp(request.args['as_of'], end_of_day=True) if request.args.get('as_of') else None
+    except ValueError:
+        abort(400, description='Dates must be YYYY-MM-DD or YYYY-MM-DDTHH:MM')
+    
+    if as_of is not None:
+        # Replayed from a snapshot in memory, so the whole report is returned in one document
+        return versioned_json(['location', 'product', 'product_movement'], lambda: {'data': [
+            api_record(item, fields)
+            for item in add_balance_names(balances_as_of(as_of, product_id, location_id))
+        ]})
     
-    return render_template('balance.html', balance_data=balance_data)
+    key_columns = [StockLevel.product_id, StockLevel.location_id]
+    query = db.session.query(
+        StockLevel.product_id,
+        Product.name.label('product_name'),
+        StockLevel.location_id,
+        Location.name.label('location_name'),
+        StockLevel.qty.label('balance')
+    ).join(Product, Product.product_id == StockLevel.product_id).join(
+        Location, Location.location_id == StockLevel.location_id
+    ).filter(StockLevel.qty != 0)
+    if product_id:
+        query = query.filter(StockLevel.product_id == product_id)
+    if location_id:
+        query = query.filter(StockLevel.location_id == location_id)
+    return versioned_json(['location', 'product', 'stock_level'],
+                          lambda: api_page(paginate_keyset(query, key_columns), fields))
+
+@app.route('/api/v1/analytics')
+def api_analytics():
+    fields = api_fields(ANALYTICS_FIELDS)
+    window = analytics_window()
+    if window is None:
+        abort(400, description=f'Window must be one of {", ".join(map(str, app.config["ANALYTICS_WINDOWS"]))} days')
+    cells, total = analytics_report(
+        window,
+        request.args.get('product_id', '').strip(),
+        request.args.get('location_id', '').strip(),
+        reorder_only=request.args.get('reorder', '') not in ('', '0', 'false'),
+        limit=get_page_size()
+    )
+    return jsonify({
+        'window': window,
+        'lead_time_days': app.config['ANALYTICS_LEAD_TIME_DAYS'],
+        'total': total,
+        'data': [api_record(cell, fields) for cell in cells]
+    })
+
+@app.route('/events')
+def events():
+    try:
+        after = int(request.headers.get('Last-Event-ID') or request.args.get('after') or -1)
+    except ValueError:
+        after = -1
+    subscription, missed = event_broker.subscribe(after if after >= 0 else None,
+                                                  app.config['EVENT_STREAM_MAX_CLIENTS'],
+                                                  app.config['EVENT_QUEUE_SIZE'])
+    if subscription is None:
+        abort(503, description='Too many open event streams')
+    response = Response(event_stream(subscription, missed), mimetype='text/event-stream')
+    response.cache_control.no_cache = True
+    # Keep nginx-style proxies from holding events back in their buffers
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/metrics')
+def metrics():
+    return Response(prometheus_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/performance')
+def performance():
+    return render_template('performance.html', routes=route_report(),
+                           threshold=app.config['N_PLUS_ONE_THRESHOLD'])
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        upgrade_database()
     app.run(debug=True)
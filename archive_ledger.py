@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Ledger archiving script for the Inventory Management System
+Moves movements up to a cutoff date into the compressed movement archive and
+replaces them with one opening-balance movement per product and location, so
+every balance stays exactly the same while the live ledger stops growing.
+
+Usage: python archive_ledger.py --before 2024-12-31 --yes
+"""
+
+import argparse
+import sys
+import time
+
+from app import app, compact_ledger, parse_timestamp, upgrade_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Archive old movements into opening balances.')
+    parser.add_argument('--before', required=True, help='archive movements on or before this date')
+    parser.add_argument('--yes', action='store_true', help='confirm the compaction')
+    args = parser.parse_args()
+
+    if not args.yes:
+        print("[ERROR] Archived movements leave the live ledger; pass --yes to confirm")
+        return False
+    try:
+        cutoff = parse_timestamp(args.before, end_of_day=True)
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        return False
+
+    began = time.perf_counter()
+    with app.app_context():
+        upgrade_database()
+        try:
+            archived, openings = compact_ledger(
+                cutoff, progress=lambda done, total: print(f"  {done}/{total} products compacted...", end='\r'))
+        except ValueError as e:
+            print(f"[ERROR] {e}")
+            return False
+    elapsed = time.perf_counter() - began
+    print(f"[OK] Archived {archived} movements into {openings} opening balances in {elapsed:.1f}s")
+    return True
+
+
+if __name__ == '__main__':
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark script for the Inventory Management System
+Times the balance engine (grouped ledger aggregate and materialized stock level
+lookup) against the old per-cell query loop, and full-text search against the old
+LIKE scans, on synthetic data stored in a temporary SQLite database, so the real inventory.db is never touched.
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from flask import Flask, current_app
+
+from app import db, Product, Location, ProductMovement, compute_balances, ledger_totals, search_page
+from generate_data import generate_dataset
+
+
+def make_bench_app(db_path):
+    bench_app = Flask(__name__)
+    bench_app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    bench_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(bench_app)
+    return bench_app
+
+
+def legacy_balances():
+    """The original /balance implementation: two SUM queries per cell."""
+    balance_data = []
+    for product in Product.query.all():
+        for location in Location.query.all():
+            incoming = db.session.query(db.func.sum(ProductMovement.qty)).filter(
+                ProductMovement.to_location == location.location_id,
+                ProductMovement.product_id == product.product_id
+            ).scalar() or 0
+            outgoing = db.session.query(db.func.sum(ProductMovement.qty)).filter(
+                ProductMovement.from_location == location.location_id,
+                ProductMovement.product_id == product.product_id
+            ).scalar() or 0
+            if incoming - outgoing != 0:
+                balance_data.append((product.product_id, location.location_id, incoming - outgoing))
+    return balance_data
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def bench_balance():
+    print("Balance engine vs. per-cell loop")
+    print("-" * 70)
+    print(f"{'products':>9} {'locations':>10} {'movements':>10} {'cells':>7} "
+          f"{'stock ms':>9} {'ledger ms':>10} {'legacy ms':>10}")
+    scenarios = [
+        (20, 10, 10000),
+        (20, 10, 100000),
+        (200, 50, 10000),
+        (2000, 100, 10000),
+    ]
+    for num_products, num_locations, num_movements in scenarios:
+        generate_dataset(num_products, num_locations, num_movements)
+        rows, stock_ms = timed(compute_balances)
+        ledger_rows, ledger_ms = timed(lambda: db.session.execute(ledger_totals()).all())
+        assert len(ledger_rows) == len(rows)
+        if num_products * num_locations <= 2000:
+            legacy_rows, legacy_ms = timed(legacy_balances)
+            assert len(legacy_rows) == len(rows)
+            legacy = f"{legacy_ms:10.1f}"
+        else:
+            legacy = f"{'skipped':>10}"
+        print(f"{num_products:9d} {num_locations:10d} {num_movements:10d} {len(rows):7d} "
+              f"{stock_ms:9.1f} {ledger_ms:10.1f} {legacy}")
+
+
+def bench_search(num_movements=1000000):
+    print(f"\nFull-text search vs. LIKE scan ({num_movements} movements)")
+    print("-" * 70)
+    print(f"{'search':>12} {'fts ms':>9} {'like ms':>9}")
+    generate_dataset(5000, 200, num_movements)
+    for term in ['M00012345', 'P000042', 'Location 17', 'Prod']:
+        with current_app.test_request_context(f'/movements?search={term}'):
+            _, fts_ms = timed(lambda: search_page(ProductMovement.query, ProductMovement.movement_id,
+                                                  'movement_search', term))
+        like = ProductMovement.query.join(Product).filter(
+            ProductMovement.movement_id.contains(term) |
+            Product.product_id.contains(term) |
+            Product.name.contains(term)
+        ).order_by(ProductMovement.timestamp.desc()).limit(50)
+        _, like_ms = timed(like.all)
+        print(f"{term:>12} {fts_ms:9.1f} {like_ms:9.1f}")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        bench_app = make_bench_app(os.path.join(tmp, 'bench.db'))
+        with bench_app.app_context():
+            bench_balance()
+            bench_search()
+            db.session.remove()
+            db.engine.dispose()
+    return True
+
+
+if __name__ == '__main__':
+    success = main()
+    sys.exit(0 if success else 1)
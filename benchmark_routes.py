@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Route benchmark for the Inventory Management System
+Drives the main pages, searches and movement posting through the Flask test client
+on a generated dataset, and reports latency percentiles and SQL queries per request.
+Pages are timed with the page cache off; cached pages are timed again as cache hits,
+reported as "<route> (cached)".
+Save a run with --save and check a later run against it with --compare; the script
+fails when a route's median latency or query count has regressed.
+
+Usage: python benchmark_routes.py [--movements 200000] [--requests 50] [--save run.json] [--compare baseline.json]
+       python benchmark_routes.py --database bench.db    # a dataset built by generate_data.py
+"""
+
+import argparse
+import gc
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+PAGE_SCENARIOS = [
+    ('dashboard', '/'),
+    ('products', '/products'),
+    ('product search', '/products?search=Product 42'),
+    ('locations', '/locations'),
+    ('movements', '/movements'),
+    ('movement search', '/movements?search=P000042'),
+    ('balance', '/balance'),
+    ('balance as of', '/balance?as_of=2024-07-01'),
+    ('api balance', '/api/v1/balance?per_page=200'),
+]
+
+# A median change smaller than this is timer noise, whatever the percentage
+NOISE_MS = 1.0
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def measure(send, count, warmup, after=None):
+    """Call ``send(i)`` ``warmup`` times untimed, then ``count`` times; summarise latency and queries.
+
+    ``after`` runs untimed after every request.
+    """
+    gc.collect()
+    for i in range(warmup):
+        send(-1 - i)
+        if after:
+            after()
+    latencies = []
+    queries = []
+    errors = 0
+    for i in range(count):
+        started = time.perf_counter()
+        response = send(i)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if after:
+            after()
+        queries.append(int(response.headers.get('X-Query-Count', 0)))
+        if response.status_code >= 400:
+            errors += 1
+    return {
+        'p50_ms': statistics.median(latencies),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'max_ms': max(latencies),
+        'queries': statistics.mean(queries),
+        'errors': errors
+    }
+
+
+def run_benchmark(args):
+    from app import app, db, Location, Product, ProductMovement
+    from generate_data import generate_dataset
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        if not args.database:
+            generate_dataset(args.products, args.locations, args.movements, skew=args.skew, seed=args.seed)
+        dataset = {
+            'products': Product.query.count(),
+            'locations': Location.query.count(),
+            'movements': ProductMovement.query.count()
+        }
+        product_ids = [row[0] for row in db.session.query(Product.product_id).order_by(Product.product_id).limit(100)]
+        location_ids = [row[0] for row in db.session.query(Location.location_id).order_by(Location.location_id).limit(10)]
+        db.session.remove()
+
+    client = app.test_client()
+    results = {}
+    max_bytes = app.config['PAGE_CACHE_MAX_BYTES']
+    app.config['PAGE_CACHE_MAX_BYTES'] = 0
+    for name, path in PAGE_SCENARIOS:
+        results[name] = measure(lambda i: client.get(path), args.requests, args.warmup)
+    app.config['PAGE_CACHE_MAX_BYTES'] = max_bytes
+    if max_bytes:
+        # Only pages behind the cache answer with X-Cache; the warmup fills it
+        for name, path in PAGE_SCENARIOS:
+            if 'X-Cache' in client.get(path).headers:
+                results[f'{name} (cached)'] = measure(lambda i: client.get(path), args.requests, args.warmup)
+
+    # Post receipts, then delete them again so a reused --database is left as it was found
+    def post(i):
+        return client.post('/movements/add', data={
+            'movement_id': f'BENCH{i:+07d}',
+            'product_id': product_ids[i % len(product_ids)],
+            'from_location': '',
+            'to_location': location_ids[i % len(location_ids)],
+            'qty': 1
+        })
+
+    def clear_flashes():
+        # Redirects are not followed, so nothing would ever display and drop these
+        with client.session_transaction() as session:
+            session.pop('_flashes', None)
+
+    results['post movement'] = measure(post, args.requests, args.warmup, clear_flashes)
+    results['delete movement'] = measure(lambda i: client.get(f'/movements/delete/BENCH{i:+07d}'),
+                                         args.requests, args.warmup, clear_flashes)
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+    return {'dataset': dataset, 'requests': args.requests, 'results': results}
+
+
+def print_results(run):
+    dataset = run['dataset']
+    print(f"Routes on {dataset['products']:,} products, {dataset['locations']:,} locations, "
+          f"{dataset['movements']:,} movements ({run['requests']} requests each)")
+    print("-" * 84)
+    print(f"{'route':<24} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'queries':>8} {'errors':>7}")
+    for name, result in run['results'].items():
+        print(f"{name:<24} {result['p50_ms']:8.1f} {result['p95_ms']:8.1f} {result['p99_ms']:8.1f} "
+              f"{result['max_ms']:8.1f} {result['queries']:8.1f} {result['errors']:7d}")
+
+
+def compare(run, baseline, tolerance):
+    """Print the change against ``baseline`` per route and return the names of regressed routes."""
+    if baseline['dataset'] != run['dataset']:
+        print(f"\n[WARNING] Baseline dataset differs: {baseline['dataset']}")
+    print(f"\nCompared with baseline (median tolerance {tolerance:.0f}%)")
+    print("-" * 84)
+    print(f"{'route':<24} {'base p50':>9} {'p50':>8} {'change':>8} {'base p95':>9} {'p95':>8} "
+          f"{'base q':>7} {'queries':>8}")
+    regressions = []
+    for name, result in run['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            print(f"{name:<24} {'new':>9} {result['p50_ms']:8.1f}")
+            continue
+        change = (result['p50_ms'] - base['p50_ms']) / base['p50_ms'] * 100 if base['p50_ms'] else 0.0
+        slower = change > tolerance and result['p50_ms'] - base['p50_ms'] > NOISE_MS
+        more_queries = result['queries'] > base['queries']
+        flag = '  REGRESSION' if slower or more_queries else ''
+        if flag:
+            regressions.append(name)
+        print(f"{name:<24} {base['p50_ms']:9.1f} {result['p50_ms']:8.1f} {change:+7.0f}% "
+              f"{base['p95_ms']:9.1f} {result['p95_ms']:8.1f} {base['queries']:7.1f} {result['queries']:8.1f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the main routes on a generated dataset.')
+    parser.add_argument('--database', help='existing dataset from generate_data.py (default: generate a temporary one)')
+    parser.add_argument('--products', type=int, default=2000, help='products to generate (default: 2000)')
+    parser.add_argument('--locations', type=int, default=100, help='locations to generate (default: 100)')
+    parser.add_argument('--movements', type=int, default=200000, help='movements to generate (default: 200000)')
+    parser.add_argument('--skew', type=float, default=1.0, help='Zipf skew of the generated data (default: 1.0)')
+    parser.add_argument('--seed', type=int, default=42, help='random seed of the generated data (default: 42)')
+    parser.add_argument('--requests', type=int, default=50, help='timed requests per route (default: 50)')
+    parser.add_argument('--warmup', type=int, default=3, help='untimed requests per route first (default: 3)')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file from an earlier --save')
+    parser.add_argument('--tolerance', type=float, default=25,
+                        help='allowed median slowdown against the baseline, in percent (default: 25)')
+    args = parser.parse_args()
+
+    if args.database and not os.path.exists(args.database):
+        print(f"[ERROR] {args.database} not found; create it with generate_data.py")
+        return False
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # The app reads its database URI at import, so point it at the dataset first
+        path = os.path.abspath(args.database) if args.database else os.path.join(tmp, 'bench.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+        os.environ.setdefault('SECRET_KEY', 'benchmark')
+        run = run_benchmark(args)
+
+    print_results(run)
+    success = not any(result['errors'] for result in run['results'].values())
+    if not success:
+        print("[ERROR] Some requests failed")
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(run, f, indent=2)
+        print(f"[OK] Saved results to {args.save}")
+    if baseline is not None:
+        regressions = compare(run, baseline, args.tolerance)
+        if regressions:
+            print(f"[ERROR] Regressed: {', '.join(regressions)}")
+            success = False
+        else:
+            print("[OK] No route regressed")
+    return success
+
+
+if __name__ == '__main__':
+    success = main()
+    sys.exit(0 if success else 1)
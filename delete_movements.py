@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Bulk delete script for the Inventory Management System
+Deletes movements (all of them, or only those matching a date range, product or
+location) in set-based chunks, keeping stock levels in step and reporting progress.
+
+Usage: python delete_movements.py [--start 2025-01-01] [--end 2025-01-31] [--product P001]
+                                  [--location L001] [--chunk-size 5000] --yes
+"""
+
+import argparse
+import sys
+import time
+
+from app import app, delete_movements, parse_timestamp
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Delete product movements in bulk.')
+    parser.add_argument('--start', help='only movements on or after this date')
+    parser.add_argument('--end', help='only movements on or before this date')
+    parser.add_argument('--product', help='only movements of this product ID')
+    parser.add_argument('--location', help='only movements into or out of this location ID')
+    parser.add_argument('--chunk-size', type=int, help=f"rows per transaction (default: {app.config['DELETE_CHUNK_SIZE']})")
+    parser.add_argument('--yes', action='store_true', help='confirm the deletion')
+    args = parser.parse_args()
+
+    if not args.yes:
+        print("[ERROR] Deleting movements cannot be undone; pass --yes to confirm")
+        return False
+    try:
+        start = parse_timestamp(args.start) if args.start else None
+        end = parse_timestamp(args.end, end_of_day=True) if args.end else None
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        return False
+
+    began = time.perf_counter()
+    with app.app_context():
+        deleted, error = delete_movements(start, end, args.product, args.location, args.chunk_size,
+                                          progress=lambda count: print(f"  {count} movements deleted...", end='\r'))
+    elapsed = time.perf_counter() - began
+    if error:
+        print(f"[ERROR] {error}")
+        return False
+    print(f"[OK] Deleted {deleted} movements in {elapsed:.1f}s")
+    return True
+
+
+if __name__ == '__main__':
+    success = main()
+    sys.exit(0 if success else 1)
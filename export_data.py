@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Export script for the Inventory Management System
+Streams the movement ledger, the movement archive or the balance report to CSV
+or JSON lines without loading the whole result into memory.
+
+Usage: python export_data.py movements [--format csv|jsonl] [--start 2025-01-01] [--end 2025-01-31]
+                                       [--product P001] [--location L001] [-o movements.csv]
+       python export_data.py archive [same filters as movements]
+       python export_data.py balance [--format csv|jsonl] [--as-of 2025-01-31] [-o balance.csv]
+"""
+
+import argparse
+import sys
+
+from app import (app, add_balance_names, archived_movements, balances_as_of, balance_export_query, iter_export,
+                 iter_query_rows, movement_export_query, parse_timestamp,
+                 BALANCE_EXPORT_FIELDS, MOVEMENT_EXPORT_FIELDS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export movements or balances as CSV or JSON lines.')
+    parser.add_argument('dataset', choices=['movements', 'archive', 'balance'])
+    parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+    parser.add_argument('--start', help='movements on or after this date')
+    parser.add_argument('--end', help='movements on or before this date')
+    parser.add_argument('--as-of', help='balance as of this date instead of now')
+    parser.add_argument('--product', help='only this product ID')
+    parser.add_argument('--location', help='only this location ID')
+    parser.add_argument('-o', '--output', help='output file (default: stdout)')
+    args = parser.parse_args()
+
+    try:
+        start = parse_timestamp(args.start) if args.start else None
+        end = parse_timestamp(args.end, end_of_day=True) if args.end else None
+        as_of = parse_timestamp(args.as_of, end_of_day=True) if args.as_of else None
+    except ValueError as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        return False
+
+    output = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    with app.app_context():
+        if args.dataset == 'movements':
+            rows = iter_query_rows(movement_export_query(start, end, args.product, args.location))
+            fields = MOVEMENT_EXPORT_FIELDS
+        elif args.dataset == 'archive':
+            rows = archived_movements(start, end, args.product, args.location)
+            fields = MOVEMENT_EXPORT_FIELDS
+        elif as_of is not None:
+            rows = ([item[field] for field in BALANCE_EXPORT_FIELDS]
+                    for item in add_balance_names(balances_as_of(as_of, args.product, args.location)))
+            fields = BALANCE_EXPORT_FIELDS
+        else:
+            rows = iter_query_rows(balance_export_query(args.product, args.location))
+            fields = BALANCE_EXPORT_FIELDS
+        for chunk in iter_export(rows, fields, args.format):
+            output.write(chunk)
+    if args.output:
+        output.close()
+        print(f"[OK] Exported {args.dataset} to {args.output}", file=sys.stderr)
+    return True
+
+
+if __name__ == '__main__':
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Synthetic data generator for the Inventory Management System
+Builds a reproducible dataset of any size (products, locations and a movement ledger
+with optional Zipf skew towards popular products and busy locations) with bulk inserts,
+then rebuilds stock levels and the search index once at the end. The same arguments
+and seed always produce the same database.
+
+Usage: python generate_data.py bench.db [--products 50000] [--locations 1000] [--movements 10000000] [--skew 1.1]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from array import array
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+DEFAULT_START = datetime(2024, 1, 1)
+
+
+def zipf_weights(count, skew):
+    """Cumulative weights for picking ranks 0..count-1 with probability proportional to 1 / (rank + 1) ** skew."""
+    return list(accumulate(1 / (rank + 1) ** skew for rank in range(count)))
+
+
+def generate_dataset(num_products, num_locations, num_movements, skew=0.0, seed=42,
+                     start=DEFAULT_START, days=365, batch_size=50000, progress=None):
+    """Replace the current database with a synthetic dataset.
+
+    Half of the movements are receipts and half are transfers or shipments out of a
+    location. Outgoing quantities are capped at the stock on hand, and an outgoing
+    movement from an empty cell becomes a receipt, so no stock level goes negative.
+    Movements are spread evenly over ``days`` from ``start``. ``skew`` is the Zipf
+    exponent for choosing products and locations (0 picks them uniformly).
+    ``progress`` is called with the running count of movements after every batch.
+    """
+    from app import (db, Location, Product, ProductMovement, BUMP_VERSION, MOVEMENT_SEARCH_FILL,
+                     rebuild_stock_levels, search_index_enabled, upgrade_database)
+
+    db.drop_all()
+    # Pooled connections can hold statements prepared against the dropped tables
+    db.session.remove()
+    db.engine.dispose()
+    upgrade_database()
+    for first in range(0, num_products, batch_size):
+        db.session.execute(db.insert(Product), [
+            {'product_id': f'P{i:06d}', 'name': f'Product {i}', 'description': None}
+            for i in range(first, min(first + batch_size, num_products))
+        ])
+    db.session.execute(db.insert(Location), [
+        {'location_id': f'L{i:05d}', 'name': f'Location {i}', 'address': None}
+        for i in range(num_locations)
+    ])
+    db.session.commit()
+
+    # Load the ledger without its secondary indexes and search trigger, then build both once
+    connection = db.session.connection()
+    indexes = list(ProductMovement.__table__.indexes)
+    for index in indexes:
+        index.drop(bind=connection)
+    suspend_search = search_index_enabled()
+    if suspend_search:
+        db.session.execute(db.text('INSERT INTO search_index_suspended (flag) VALUES (1)'))
+
+    rng = random.Random(seed)
+    product_weights = zipf_weights(num_products, skew) if skew else None
+    location_weights = zipf_weights(num_locations, skew) if skew else None
+    stock = array('q', bytes(8 * num_products * num_locations))
+    step = timedelta(days=days) / max(num_movements, 1)
+    for first in range(0, num_movements, batch_size):
+        count = min(batch_size, num_movements - first)
+        products = rng.choices(range(num_products), cum_weights=product_weights, k=count)
+        destinations = rng.choices(range(num_locations), cum_weights=location_weights, k=count)
+        sources = rng.choices(range(num_locations), cum_weights=location_weights, k=count)
+        movements = []
+        for offset in range(count):
+            product = products[offset]
+            to_location = destinations[offset]
+            from_location = None
+            qty = rng.randint(1, 50)
+            if rng.random() < 0.5:
+                from_location = sources[offset]
+                available = stock[product * num_locations + from_location]
+                if available:
+                    qty = min(qty, available)
+                    if rng.random() < 0.5:
+                        to_location = None    # shipment out of the network
+                else:
+                    from_location = None      # nothing to move, so receive instead
+            if from_location is not None:
+                stock[product * num_locations + from_location] -= qty
+            if to_location is not None:
+                stock[product * num_locations + to_location] += qty
+            movements.append({
+                'movement_id': f'M{first + offset:08d}',
+                'timestamp': start + step * (first + offset),
+                'product_id': f'P{product:06d}',
+                'from_location': f'L{from_location:05d}' if from_location is not None else None,
+                'to_location': f'L{to_location:05d}' if to_location is not None else None,
+                'qty': qty
+            })
+        db.session.execute(ProductMovement.__table__.insert(), movements)
+        db.session.commit()
+        if progress:
+            progress(first + count)
+
+    connection = db.session.connection()
+    for index in indexes:
+        index.create(bind=connection)
+    if suspend_search:
+        db.session.execute(db.text(MOVEMENT_SEARCH_FILL))
+        db.session.execute(db.text("INSERT INTO movement_search(movement_search) VALUES ('optimize')"))
+        db.session.execute(db.text(BUMP_VERSION.format(count=num_movements, rows=num_movements,
+                                                       table='product_movement')))
+        db.session.execute(db.text('DELETE FROM search_index_suspended'))
+    db.session.commit()
+    rebuild_stock_levels()
+    db.session.execute(db.text('ANALYZE'))
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic inventory dataset.')
+    parser.add_argument('database', help='SQLite database file to create')
+    parser.add_argument('--products', type=int, default=50000, help='number of products (default: 50000)')
+    parser.add_argument('--locations', type=int, default=1000, help='number of locations (default: 1000)')
+    parser.add_argument('--movements', type=int, default=1000000, help='number of movements (default: 1000000)')
+    parser.add_argument('--skew', type=float, default=1.0,
+                        help='Zipf exponent for popular products and busy locations, 0 for uniform (default: 1.0)')
+    parser.add_argument('--start', type=datetime.fromisoformat, default=DEFAULT_START,
+                        help='date of the first movement (default: 2024-01-01)')
+    parser.add_argument('--days', type=int, default=365, help='days of history (default: 365)')
+    parser.add_argument('--seed', type=int, default=42, help='random seed (default: 42)')
+    parser.add_argument('--batch-size', type=int, default=50000, help='rows per insert transaction (default: 50000)')
+    parser.add_argument('--force', action='store_true', help='overwrite the database file if it exists')
+    args = parser.parse_args()
+
+    path = os.path.abspath(args.database)
+    if os.path.exists(path) and not args.force:
+        print(f"[ERROR] {args.database} already exists; pass --force to overwrite it")
+        return False
+    # The app reads its database URI at import, so point it at the target first
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    from app import app
+
+    started = time.perf_counter()
+
+    def report(count):
+        print(f"  {count:,} movements ({time.perf_counter() - started:.0f}s)", flush=True)
+
+    print(f"Generating {args.products:,} products, {args.locations:,} locations and "
+          f"{args.movements:,} movements (skew {args.skew}, seed {args.seed})")
+    with app.app_context():
+        generate_dataset(args.products, args.locations, args.movements, skew=args.skew, seed=args.seed,
+                         start=args.start, days=args.days, batch_size=args.batch_size, progress=report)
+    print(f"[OK] Wrote {args.database} in {time.perf_counter() - started:.0f}s")
+    return True
+
+
+if __name__ == '__main__':
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Bulk import script for the Inventory Management System
+Streams movements from a CSV or JSON-lines file (or stdin) into the ledger in
+batched transactions, reporting rows that could not be imported.
+
+Usage: python import_movements.py movements.csv [--format csv|jsonl] [--batch-size 5000]
+"""
+
+import argparse
+import io
+import sys
+import time
+
+from app import app, import_movements, detect_import_format
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import product movements from CSV or JSON lines.')
+    parser.add_argument('path', help="file to import, or '-' to read from stdin")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help='input format (default: from file extension)')
+    parser.add_argument('--batch-size', type=int, help=f"rows per transaction (default: {app.config['IMPORT_BATCH_SIZE']})")
+    args = parser.parse_args()
+
+    fmt = args.format or detect_import_format(args.path)
+    if args.path == '-':
+        stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='')
+    else:
+        stream = open(args.path, encoding='utf-8-sig', newline='')
+
+    start = time.perf_counter()
+    with app.app_context(), stream:
+        result = import_movements(stream, fmt, args.batch_size,
+                                  progress=lambda count: print(f"  {count} movements imported...", end='\r'))
+    elapsed = time.perf_counter() - start
+
+    for line_number, message in result.errors:
+        print(f"[ERROR] line {line_number}: {message}")
+    rate = result.imported / elapsed if elapsed else 0
+    print(f"[OK] Imported {result.imported} movements in {elapsed:.1f}s ({rate:,.0f} rows/s), "
+          f"{len(result.errors)} row(s) skipped")
+    return not result.errors
+
+
+if __name__ == '__main__':
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Load test for the Inventory Management System
+Serves the app with waitress on synthetic data in a temporary SQLite database and
+measures how long concurrent readers wait while a writer keeps posting movements
+through /movements/add, once with SQLite's rollback journal and once with WAL.
+
+Usage: python load_test.py [--readers 8] [--seconds 10] [--movements 200000]
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+JOURNAL_MODES = ['DELETE', 'WAL']
+READ_PATHS = ['/api/v1/balance?per_page=200', '/movements?per_page=50', '/api/v1/movements?per_page=200']
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def timed_request(request):
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=60) as response:
+        response.read()
+    return (time.perf_counter() - start) * 1000
+
+
+def run_load(args):
+    """Seed the database named by DATABASE_URL, serve it and hammer it; print one result line."""
+    from waitress.server import create_server
+
+    from app import app, db
+    from generate_data import generate_dataset
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        generate_dataset(200, 20, args.movements)
+        db.session.remove()
+
+    # A queue of waiting requests is the point of the test, so do not warn about it
+    logging.getLogger('waitress.queue').setLevel(logging.ERROR)
+    server = create_server(app, host='127.0.0.1', port=0, threads=args.readers + 2)
+    threading.Thread(target=server.run, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.effective_port}'
+
+    deadline = time.perf_counter() + args.seconds
+    read_latencies = []
+    write_latencies = []
+    errors = []
+
+    def reader(index):
+        count = 0
+        while time.perf_counter() < deadline:
+            try:
+                read_latencies.append(timed_request(base_url + READ_PATHS[(index + count) % len(READ_PATHS)]))
+            except Exception as e:
+                errors.append(e)
+            count += 1
+
+    def writer():
+        count = 0
+        while time.perf_counter() < deadline:
+            data = urllib.parse.urlencode({
+                'movement_id': f'LOAD{count:08d}',
+                'product_id': f'P{count % 200:06d}',
+                'from_location': '',
+                'to_location': f'L{count % 20:05d}',
+                'qty': 1
+            }).encode()
+            try:
+                write_latencies.append(timed_request(urllib.request.Request(base_url + '/movements/add', data=data)))
+            except Exception as e:
+                errors.append(e)
+            count += 1
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(args.readers)]
+    threads.append(threading.Thread(target=writer))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    server.close()
+
+    print(f"{app.config['SQLITE_JOURNAL_MODE']:>8} {len(read_latencies):7d} "
+          f"{statistics.median(read_latencies or [0]):8.1f} {percentile(read_latencies, 99):8.1f} "
+          f"{max(read_latencies or [0]):8.1f} {len(write_latencies):7d} "
+          f"{statistics.median(write_latencies or [0]):8.1f} {len(errors):7d}")
+    return not errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure reader latency under concurrent movement writes.')
+    parser.add_argument('--readers', type=int, default=8, help='concurrent reader threads (default: 8)')
+    parser.add_argument('--seconds', type=int, default=10, help='duration of each run (default: 10)')
+    parser.add_argument('--movements', type=int, default=200000, help='movements to seed (default: 200000)')
+    parser.add_argument('--run', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        return run_load(args)
+
+    # Each journal mode runs in a fresh interpreter, since the app reads its config at import
+    print(f"Concurrent readers vs. /movements/add ({args.readers} readers, {args.seconds}s, "
+          f"{args.movements} movements)")
+    print("-" * 70)
+    print(f"{'journal':>8} {'reads':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} "
+          f"{'writes':>7} {'w p50':>8} {'errors':>7}")
+    success = True
+    for mode in JOURNAL_MODES:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ,
+                       DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'load.db')}",
+                       SQLITE_JOURNAL_MODE=mode,
+                       SECRET_KEY='load-test')
+            result = subprocess.run([sys.executable, __file__, '--run', '--readers', str(args.readers),
+                                     '--seconds', str(args.seconds), '--movements', str(args.movements)],
+                                    env=env)
+            success = success and result.returncode == 0
+    return success
+
+
+if __name__ == '__main__':
+    success = main()
+    sys.exit(0 if success else 1)
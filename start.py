@@ -1,14 +1,48 @@
 #!/usr/bin/env python3
 """
 Startup script for the Inventory Management System
-This script will initialize the database with sample data and start the Flask application
+This script will initialize the database with sample data and start the Flask application.
+With --production it keeps the existing data, upgrades the schema and serves the app
+from the multi-threaded waitress WSGI server instead of the debug server.
 """
 
+import argparse
 import os
 import sys
 import subprocess
 
+def serve_production(host, port, threads):
+    """Upgrade the database in place and serve the app with waitress."""
+    if not os.environ.get('SECRET_KEY'):
+        print("[ERROR] Set the SECRET_KEY environment variable before running in production")
+        return False
+    try:
+        from waitress import serve
+    except ImportError as e:
+        print(f"[ERROR] Missing dependency: {e}")
+        print("Please run: pip install -r requirements.txt")
+        return False
+    
+    from app import app, upgrade_database
+    with app.app_context():
+        names = upgrade_database()
+    print(f"[OK] Database is up to date ({len(names)} migration(s) applied)")
+    print(f"\nServing on http://{host}:{port} with {threads} threads")
+    print("Press Ctrl+C to stop the server")
+    print("=" * 50)
+    serve(app, host=host, port=port, threads=threads)
+    return True
+
 def main():
+    parser = argparse.ArgumentParser(description='Start the Inventory Management System.')
+    parser.add_argument('--production', action='store_true',
+                        help='keep existing data and serve with waitress instead of the debug server')
+    parser.add_argument('--host', default=os.environ.get('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 5000)))
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('WEB_THREADS', 8)),
+                        help='worker threads in production mode (default: 8)')
+    args = parser.parse_args()
+    
     print("Inventory Management System - Startup Script")
     print("=" * 50)
     
@@ -25,6 +59,13 @@ def main():
         print("Please run: pip install -r requirements.txt")
         return False
     
+    if args.production:
+        try:
+            return serve_production(args.host, args.port, args.threads)
+        except KeyboardInterrupt:
+            print("\n\nServer stopped by user")
+            return True
+    
     # Initialize database with sample data
     print("\nInitializing database with sample data...")
     try:
@@ -37,13 +78,13 @@ def main():
     
     # Start the Flask application
     print("\nStarting Flask application...")
-    print("The application will be available at: http://localhost:5000")
+    print(f"The application will be available at: http://localhost:{args.port}")
     print("Press Ctrl+C to stop the server")
     print("=" * 50)
     
     try:
         from app import app
-        app.run(debug=True, host='0.0.0.0', port=5000)
+        app.run(debug=True, host=args.host, port=args.port)
     except KeyboardInterrupt:
         print("\n\nServer stopped by user")
         return True
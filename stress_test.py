@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Stress test for the Inventory Management System
+Many threads post, transfer and delete movements through the real routes against
+a small set of contended stock cells in a temporary SQLite database. Checks that no
+stock level ever goes below zero and that stock levels still match the ledger,
+and reports posting throughput.
+
+Usage: python stress_test.py [--threads 16] [--posts 200] [--products 3] [--locations 3]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run_stress(args):
+    from app import app, db, upgrade_database, verify_stock_levels, Location, Product, ProductMovement, StockLevel
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    products = [f'P{i:03d}' for i in range(args.products)]
+    locations = [f'L{i:03d}' for i in range(args.locations)]
+    with app.app_context():
+        upgrade_database()
+        db.session.add_all([Product(product_id=product_id, name=f'Product {product_id}') for product_id in products])
+        db.session.add_all([Location(location_id=location_id, name=f'Location {location_id}') for location_id in locations])
+        db.session.commit()
+
+    latencies = []
+    counts = {'posted': 0, 'rejected': 0, 'deleted': 0, 'errors': 0}
+    lowest = [0]
+    done = threading.Event()
+    lock = threading.Lock()
+
+    def record(outcome, started):
+        with lock:
+            counts[outcome] += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    def take_flashes(client):
+        # Pop flashed messages so they do not pile up in the session cookie between requests
+        with client.session_transaction() as session:
+            return [category for category, _ in session.pop('_flashes', [])]
+
+    def worker(index):
+        rng = random.Random(index)
+        client = app.test_client()
+        mine = []
+        for count in range(args.posts):
+            started = time.perf_counter()
+            roll = rng.random()
+            if roll < 0.1 and mine:
+                movement_id = mine.pop(rng.randrange(len(mine)))
+                response = client.get(f'/movements/delete/{movement_id}')
+                if response.status_code != 302:
+                    record('errors', started)
+                elif 'error' in take_flashes(client):
+                    mine.append(movement_id)
+                    record('rejected', started)
+                else:
+                    record('deleted', started)
+                continue
+            movement_id = f'T{index:03d}-{count:06d}'
+            source, destination = rng.sample(locations, 2)
+            data = {'movement_id': movement_id, 'product_id': rng.choice(products), 'qty': rng.randint(1, 10)}
+            if roll < 0.35:
+                data.update(from_location='', to_location=destination)    # receipt
+            elif roll < 0.7:
+                data.update(from_location=source, to_location=destination)  # transfer
+            else:
+                data.update(from_location=source, to_location='')         # shipment
+            response = client.post('/movements/add', data=data)
+            take_flashes(client)
+            if response.status_code == 302:
+                mine.append(movement_id)
+                record('posted', started)
+            elif b'available at' in response.data:
+                record('rejected', started)
+            else:
+                record('errors', started)
+
+    def monitor():
+        # Sample the lowest stock level while the workers run
+        with app.app_context():
+            while not done.is_set():
+                value = db.session.execute(db.select(db.func.min(StockLevel.qty))).scalar()
+                db.session.rollback()
+                if value is not None:
+                    lowest[0] = min(lowest[0], value)
+                time.sleep(0.01)
+
+    watcher = threading.Thread(target=monitor)
+    watcher.start()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+    done.set()
+    watcher.join()
+
+    with app.app_context():
+        mismatches = verify_stock_levels()
+        final_lowest = db.session.execute(db.select(db.func.min(StockLevel.qty))).scalar() or 0
+        movements = ProductMovement.query.count()
+        db.session.remove()
+        db.engine.dispose()
+
+    operations = sum(counts.values())
+    print(f"Stress test: {args.threads} threads x {args.posts} operations on "
+          f"{args.products} products x {args.locations} locations")
+    print("-" * 70)
+    print(f"posted {counts['posted']}, rejected for insufficient stock {counts['rejected']}, "
+          f"deleted {counts['deleted']}, errors {counts['errors']}; {movements} movements remain")
+    print(f"{operations / elapsed:,.0f} operations/s; latency p50 {statistics.median(latencies or [0]):.1f} ms, "
+          f"p99 {percentile(latencies, 99):.1f} ms")
+    ok = True
+    if min(lowest[0], final_lowest) < 0:
+        print(f"[ERROR] A stock level went negative (lowest seen: {min(lowest[0], final_lowest)})")
+        ok = False
+    if mismatches:
+        print(f"[ERROR] {len(mismatches)} stock level(s) disagree with the ledger")
+        ok = False
+    if counts['errors']:
+        print(f"[ERROR] {counts['errors']} operation(s) failed unexpectedly")
+        ok = False
+    if ok:
+        print("[OK] No stock level went negative and every level matches the ledger")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stress concurrent movement posting.')
+    parser.add_argument('--threads', type=int, default=16, help='concurrent posting threads (default: 16)')
+    parser.add_argument('--posts', type=int, default=200, help='operations per thread (default: 200)')
+    parser.add_argument('--products', type=int, default=3, help='products to contend on (default: 3)')
+    parser.add_argument('--locations', type=int, default=3, help='locations to contend on (default: 3)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # The app reads its database URI at import, so point it at the scratch database first
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'stress.db')}"
+        os.environ.setdefault('SECRET_KEY', 'stress-test')
+        return run_stress(args)
+
+
+if __name__ == '__main__':
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,27 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app reads its database URI at import, so point it at a scratch file first
+DATABASE = os.path.join(tempfile.mkdtemp(), 'test.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DATABASE}'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, db, page_cache, upgrade_database  # noqa: E402
+
+
+@pytest.fixture
+def database():
+    """An empty, fully upgraded database inside an app context, removed again afterwards."""
+    # Table versions restart with every database, so pages cached by an earlier test would match
+    page_cache.clear()
+    with app.app_context():
+        upgrade_database()
+        yield db
+        db.session.remove()
+        db.engine.dispose()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(DATABASE + suffix):
+            os.remove(DATABASE + suffix)
@@ -0,0 +1,42 @@
+from datetime import datetime
+
+from app import (app, Location, Product, ProductMovement, balances_as_of, compact_ledger, parse_timestamp,
+                 rebuild_stock_levels)
+
+
+def seed(db):
+    db.session.add_all([Product(product_id='P1', name='Widget'), Location(location_id='L1', name='Main')])
+    db.session.add_all([
+        ProductMovement(movement_id='M1', timestamp=datetime(2025, 1, 1), product_id='P1', to_location='L1', qty=10),
+        ProductMovement(movement_id='M2', timestamp=datetime(2025, 1, 5), product_id='P1', from_location='L1', qty=4),
+        ProductMovement(movement_id='M3', timestamp=datetime(2025, 1, 20), product_id='P1', to_location='L1', qty=1)
+    ])
+    db.session.commit()
+    rebuild_stock_levels()
+
+
+def test_parse_timestamp_converts_offsets_to_naive_utc():
+    assert parse_timestamp('2025-01-10T00:00Z') == datetime(2025, 1, 10)
+    assert parse_timestamp('2025-01-10T05:30+05:30') == datetime(2025, 1, 10)
+    assert parse_timestamp('2025-01-10', end_of_day=True) == datetime(2025, 1, 10, 23, 59, 59, 999999)
+
+
+def test_compaction_keeps_every_balance(database):
+    seed(database)
+    assert compact_ledger(datetime(2025, 1, 10)) == (2, 1)
+    assert database.session.query(ProductMovement).count() == 2
+    assert [item['balance'] for item in balances_as_of(datetime(2025, 1, 31))] == [7]
+    assert [item['balance'] for item in balances_as_of(datetime(2025, 1, 3))] == [10]
+
+
+def test_as_of_with_an_offset_after_compaction(database):
+    seed(database)
+    compact_ledger(datetime(2025, 1, 10))
+    client = app.test_client()
+    assert client.get('/balance?as_of=2025-01-03T00:00Z').status_code == 200
+    response = client.get('/api/v1/balance?as_of=2025-01-03T00:00%2B00:00')
+    assert response.status_code == 200
+    assert [item['balance'] for item in response.get_json()['data']] == [10]
+    response = client.get('/export/balance?as_of=2025-01-03T00:00Z')
+    assert response.status_code == 200
+    assert response.get_data(as_text=True).splitlines()[1] == 'P1,Widget,L1,Main,10'
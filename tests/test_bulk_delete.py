@@ -0,0 +1,65 @@
+from datetime import datetime
+
+from app import (Location, Product, ProductMovement, StockLevel, DeleteResult, delete_movements,
+                 rebuild_stock_levels, verify_stock_levels)
+
+
+def seed(db, movements):
+    """Add ``(timestamp, product, from, to, qty)`` movements and build their stock levels."""
+    db.session.add_all([Product(product_id='P1', name='Widget'), Product(product_id='P2', name='Gadget'),
+                        Location(location_id='L1', name='Main'), Location(location_id='L2', name='Annex')])
+    db.session.add_all(ProductMovement(movement_id=f'M{i:02d}', timestamp=timestamp, product_id=product_id,
+                                       from_location=from_location, to_location=to_location, qty=qty)
+                       for i, (timestamp, product_id, from_location, to_location, qty) in enumerate(movements))
+    db.session.commit()
+    rebuild_stock_levels()
+
+
+def stock(db):
+    return {(row.product_id, row.location_id): row.qty for row in db.session.query(StockLevel)}
+
+
+def day(n):
+    return datetime(2024, 1, n)
+
+
+def test_delete_all_spans_chunks_whose_receipts_shipped_later(database):
+    # Six receipts then six shipments: the first chunk alone would overdraw L1
+    seed(database, [(day(i), 'P1', None, 'L1', 10) for i in range(1, 7)] +
+                   [(day(i), 'P1', 'L1', None, 10) for i in range(7, 13)])
+    assert delete_movements(chunk_size=5) == DeleteResult(12, None)
+    assert database.session.query(ProductMovement).count() == 0
+    assert stock(database) == {}
+
+
+def test_delete_all_clears_stock(database):
+    seed(database, [(day(1), 'P1', None, 'L1', 10), (day(2), 'P1', 'L1', 'L2', 4),
+                    (day(3), 'P2', None, 'L2', 7)])
+    assert delete_movements(chunk_size=2) == DeleteResult(3, None)
+    assert stock(database) == {}
+
+
+def test_filtered_delete_checks_the_net_reversal_across_chunks(database):
+    seed(database, [(day(i), 'P1', None, 'L1', 10) for i in range(1, 7)] +
+                   [(day(i), 'P1', 'L1', None, 10) for i in range(7, 13)] +
+                   [(day(13), 'P2', None, 'L1', 5)])
+    assert delete_movements(product_id='P1', chunk_size=5) == DeleteResult(12, None)
+    assert stock(database) == {('P2', 'L1'): 5}
+    assert verify_stock_levels() == []
+
+
+def test_filtered_delete_that_would_overdraw_deletes_nothing(database):
+    # Removing the receipt would leave the later shipment drawing on stock that never arrived
+    seed(database, [(day(1), 'P1', None, 'L1', 10), (day(2), 'P1', None, 'L1', 3), (day(5), 'P1', 'L1', None, 8)])
+    deleted, error = delete_movements(end=day(3), chunk_size=1)
+    assert deleted == 0
+    assert 'Only 5 of P1 available at L1; cannot remove 13' in error
+    assert database.session.query(ProductMovement).count() == 3
+    assert stock(database) == {('P1', 'L1'): 5}
+
+
+def test_location_filter_reverses_both_legs_of_a_transfer(database):
+    seed(database, [(day(1), 'P1', None, 'L1', 10), (day(2), 'P1', 'L1', 'L2', 4)])
+    assert delete_movements(location_id='L2') == DeleteResult(1, None)
+    assert stock(database) == {('P1', 'L1'): 10}
+    assert verify_stock_levels() == []
@@ -0,0 +1,54 @@
+import io
+from datetime import datetime
+
+from app import (Location, Product, ProductMovement, SnapshotLevel, StockLevel, balances_as_of, import_movements,
+                 take_snapshot)
+
+
+def seed(db):
+    db.session.add_all([Product(product_id='P1', name='Widget'), Location(location_id='L1', name='Main')])
+    db.session.commit()
+
+
+def test_import_mixes_offset_naive_and_missing_timestamps(database):
+    seed(database)
+    result = import_movements(io.StringIO(
+        'movement_id,timestamp,product_id,from_location,to_location,qty\n'
+        'M1,2025-01-01T00:00:00Z,P1,,L1,10\n'
+        'M2,,P1,L1,,3\n'
+        'M3,2025-01-01T09:30:00+05:30,P1,,L1,1\n'
+    ))
+    assert result.errors == []
+    assert result.imported == 3
+    timestamps = dict(database.session.query(ProductMovement.movement_id, ProductMovement.timestamp))
+    assert timestamps['M1'] == datetime(2025, 1, 1)
+    assert timestamps['M3'] == datetime(2025, 1, 1, 4)
+    assert database.session.get(StockLevel, ('P1', 'L1')).qty == 8
+
+
+def test_import_reports_bad_rows_and_overdraws(database):
+    seed(database)
+    result = import_movements(io.StringIO(
+        '{"movement_id": "M1", "product_id": "P1", "to_location": "L1", "qty": 5}\n'
+        '{"movement_id": "M2", "product_id": "P9", "to_location": "L1", "qty": 5}\n'
+        '{"movement_id": "M3", "product_id": "P1", "from_location": "L1", "qty": 6}\n'
+        '{"movement_id": "M4", "product_id": "P1", "from_location": "L1", "qty": 5}\n'
+    ), 'jsonl')
+    assert result.imported == 2
+    assert [line for line, _ in result.errors] == [2, 3]
+    assert database.session.get(StockLevel, ('P1', 'L1')) is None
+
+
+def test_back_dated_import_repairs_snapshots(database):
+    seed(database)
+    snapshot = take_snapshot(datetime(2025, 2, 1))
+    result = import_movements(io.StringIO(
+        'movement_id,timestamp,product_id,from_location,to_location,qty\n'
+        'M1,2025-01-10,P1,,L1,10\n'
+        'M2,2025-01-20,P1,L1,,4\n'
+        'M3,2025-03-01,P1,,L1,5\n'
+    ))
+    assert result.imported == 3
+    assert database.session.query(SnapshotLevel.qty).filter_by(snapshot_id=snapshot.snapshot_id).scalar() == 6
+    assert [item['balance'] for item in balances_as_of(datetime(2025, 1, 15))] == [10]
+    assert database.session.get(StockLevel, ('P1', 'L1')).qty == 11
@@ -0,0 +1,12 @@
+from app import check_query_plans
+
+
+def test_hot_queries_use_their_indexes(database):
+    assert check_query_plans() == []
+
+
+def test_a_missing_index_is_reported(database):
+    database.session.execute(database.text('DROP INDEX ix_product_movement_timestamp'))
+    failures = [name for name, plan in check_query_plans()]
+    assert 'movements listing' in failures
+    assert 'balance by product' not in failures